@@ -4,10 +4,17 @@ import numpy as np
 from PIL import Image
 
 # Import datasets dependent files
+from datasets import coco
 from datasets import kitti
 from datasets import lisa
 from datasets import voc
 from datasets import yolo
+from datasets import fanout
+from datasets import sharding
+from datasets import validate
+from datasets import watch
+
+formats = {'coco': coco, 'kitti': kitti, 'lisa': lisa, 'voc': voc, 'yolo': yolo}
 
 def parse_args():
 	"""
@@ -23,24 +30,24 @@ def parse_args():
 	optional = parser.add_argument_group('optional arguments')
 	required.add_argument('--from',
 						  dest='from_key',
-						  required=True,
+						  required=False,
 						  help='Format to convert dataset from.',
-						  choices=['kitti','lisa','voc','yolo'],
+						  choices=['coco','kitti','lisa','voc','yolo'],
 						  type=str, nargs=1)
 	required.add_argument('--from-path',
 						  dest='from_path',
-						  required=True,
+						  required=False,
 						  help='Path to dataset you wish to convert.',
 						  type=str, nargs=1)
 	required.add_argument('--to',
                           dest='to_key',
-                          required=True,
+                          required=False,
                           help='Format to convert dataset to',
-                          choices=['kitti','lisa','voc','yolo'],
+                          choices=['coco','kitti','lisa','voc','yolo'],
                           type=str, nargs=1)
 	required.add_argument('--to-path',
 						  dest='to_path',
-						  required=True,
+						  required=False,
 						  help='Path to output dataset to convert to.',
 						  type=str, nargs=1)
 	optional.add_argument('-l', '--label',
@@ -48,18 +55,159 @@ def parse_args():
     					  required=False,
     					  help='Label file necessary for yolo conversion.',
     					  type=str, nargs=1)
+	optional.add_argument('-m', '--label-map',
+						  dest='label_map',
+						  required=False,
+						  help='Label map file to rename, merge or drop classes.',
+						  type=str, nargs=1)
+	optional.add_argument('--resize',
+						  dest='resize',
+						  required=False,
+						  help='Resize output images to WIDTH HEIGHT while converting.',
+						  metavar=('WIDTH', 'HEIGHT'),
+						  type=int, nargs=2)
+	optional.add_argument('--keep-aspect',
+						  dest='keep_aspect',
+						  required=False,
+						  help='Keep aspect ratio when resizing and pad (letterbox).',
+						  action='store_true')
+	optional.add_argument('--pad-value',
+						  dest='pad_value',
+						  required=False,
+						  help='Gray level (0-255) of the letterbox padding.',
+						  type=int, nargs=1)
+	optional.add_argument('--fanout',
+						  dest='fanout',
+						  required=False,
+						  help='Spread output files over hash or prefix subdirectories.',
+						  choices=fanout.MODES,
+						  nargs=1)
+	optional.add_argument('--fanout-levels',
+						  dest='fanout_levels',
+						  required=False,
+						  help='Levels of 256-way subdirectories for --fanout (default 2).',
+						  choices=[1, 2, 3, 4],
+						  type=int, nargs=1)
+	optional.add_argument('--tile',
+						  dest='tile',
+						  required=False,
+						  help='Cut images into tiles of WIDTH HEIGHT while converting.',
+						  metavar=('WIDTH', 'HEIGHT'),
+						  type=int, nargs=2)
+	optional.add_argument('--tile-overlap',
+						  dest='tile_overlap',
+						  required=False,
+						  help='Overlap between neighbouring tiles in pixels.',
+						  type=int, nargs=1)
+	optional.add_argument('--min-visibility',
+						  dest='min_visibility',
+						  required=False,
+						  help='Drop boxes less visible than this fraction in a tile.',
+						  type=float, nargs=1)
+	optional.add_argument('--validate', '--dry-run',
+						  dest='validate',
+						  required=False,
+						  help='Check the source dataset and report issues only.',
+						  action='store_true')
+	optional.add_argument('-j', '--jobs',
+						  dest='jobs',
+						  required=False,
+						  help='Number of worker processes.',
+						  type=int, nargs=1)
+	optional.add_argument('--shard-index',
+						  dest='shard_index',
+						  required=False,
+						  help='Index of the shard to convert (0 to NUM_SHARDS - 1).',
+						  type=int, nargs=1)
+	optional.add_argument('--num-shards',
+						  dest='num_shards',
+						  required=False,
+						  help='Split the conversion into this many shards.',
+						  type=int, nargs=1)
+	optional.add_argument('--finalize',
+						  dest='finalize',
+						  required=False,
+						  help='Merge the shards of a sharded conversion in --to-path.',
+						  action='store_true')
+	optional.add_argument('--watch',
+						  dest='watch',
+						  required=False,
+						  help='Keep converting new kitti samples to yolo as they land.',
+						  action='store_true')
+	optional.add_argument('--poll',
+						  dest='poll',
+						  required=False,
+						  help='Poll for new samples in watch mode instead of inotify.',
+						  action='store_true')
 	optional.add_argument('-v','--verbose',
                           dest='verbose',
                           required=False,
                           help='Print out during execution of the script.')
 
 	args = parser.parse_args()
+	if args.finalize:
+		if not args.to_path:
+			parser.error('--to-path is required to finalize')
+	elif not (args.from_key and args.from_path):
+		parser.error('--from and --from-path are required')
+	elif not args.validate and not (args.to_key and args.to_path):
+		parser.error('--to and --to-path are required unless validating')
+	if (args.shard_index is None) != (args.num_shards is None):
+		parser.error('--shard-index and --num-shards must be given together')
+	if args.num_shards and not 0 <= args.shard_index[0] < args.num_shards[0]:
+		parser.error('--shard-index must be between 0 and NUM_SHARDS - 1')
+	if args.resize and min(args.resize) <= 0:
+		parser.error('--resize WIDTH and HEIGHT must be positive')
+	if args.pad_value is not None and not 0 <= args.pad_value[0] <= 255:
+		parser.error('--pad-value must be between 0 and 255')
+	if args.tile and min(args.tile) <= 0:
+		parser.error('--tile WIDTH and HEIGHT must be positive')
+	if args.tile_overlap is not None:
+		if not args.tile:
+			parser.error('--tile-overlap requires --tile')
+		if not 0 <= args.tile_overlap[0] < min(args.tile):
+			parser.error('--tile-overlap must be between 0 and the tile size - 1')
+	if args.min_visibility is not None and not 0 <= args.min_visibility[0] <= 1:
+		parser.error('--min-visibility must be between 0 and 1')
 	return args
 
+def unsupported_options(convert, options):
+	"""
+	Definition: Find conversion settings a converter does not accept.
+
+	Parameters: convert - conversion function (ex. kitti.yolo)
+				options - dictionary of optional conversion settings
+	Returns: list of option names not accepted by the converter
+	"""
+	try:
+		from inspect import getfullargspec as getargspec
+	except ImportError:
+		from inspect import getargspec
+	accepted = getargspec(convert).args
+	return [o for o in sorted(options) if o not in accepted]
+
 if __name__ == '__main__':
 	# Parse command line arguments
 	args = parse_args()
 
+	# Merge the shards of a sharded conversion
+	if args.finalize:
+		if sharding.finalize(args.to_path[0]) is None:
+			exit(1)
+		print ("Finalize complete!!")
+		exit(0)
+
+	# Only check the source dataset, nothing is written
+	if args.validate:
+		if 'yolo' in args.from_key and not args.label:
+			print ("Error: A label file is necessary for yolo validation.")
+			exit(0)
+		issues = validate.validate(args.from_key[0], args.from_path[0],
+			args.label[0] if args.label else None,
+			args.label_map[0] if args.label_map else None,
+			args.jobs[0] if args.jobs else 1)
+		exit(1 if issues else 0)
+
 	# If conversion types are same, no conversion necessary (ex. both 'kitti')
 	if args.from_key == args.to_key:
 		print ("No conversion necessary.")
@@ -72,16 +220,54 @@ if __name__ == '__main__':
 			print ("Error: A label file is necessary for yolo conversion.")
 			exit(0)
 
-		# Parameters including the label file
-		params = ("'" + args.from_path[0] + "', '" + args.to_path[0] + "', '" +
-			args.label[0] + "'")
+	# Optional conversion settings, only passed along when given
+	options = {}
+	if args.label_map:
+		options['label_map'] = args.label_map[0]
+	if args.resize:
+		options['resize'] = tuple(args.resize)
+	if args.keep_aspect:
+		options['keep_aspect'] = True
+	if args.pad_value is not None:
+		options['pad_value'] = args.pad_value[0]
+	if args.tile:
+		options['tile'] = tuple(args.tile)
+	if args.tile_overlap is not None:
+		options['tile_overlap'] = args.tile_overlap[0]
+	if args.min_visibility is not None:
+		options['min_visibility'] = args.min_visibility[0]
+	if args.fanout:
+		options['layout'] = (args.fanout[0],
+			args.fanout_levels[0] if args.fanout_levels else 2)
+	if args.num_shards:
+		options['shard'] = (args.shard_index[0], args.num_shards[0])
 
-	# Otherwise set up parameters without a label file
-	else:
-		# Parameters without the label file
-		params = ("'" + args.from_path[0] + "', '" + args.to_path[0] + "'")
+	# Keep converting new samples as they land
+	if args.watch:
+		if args.from_key[0] != 'kitti' or args.to_key[0] != 'yolo':
+			print ("Error: Watch mode only supports kitti to yolo conversion.")
+			exit(0)
+		unsupported = unsupported_options(watch.watch, options)
+		if unsupported:
+			print ("Error: " + ", ".join(unsupported) +
+				" not supported in watch mode.")
+			exit(0)
+		watch.watch(args.from_path[0], args.to_path[0], args.label[0],
+			jobs=args.jobs[0] if args.jobs else 1, polling=args.poll, **options)
+		exit(0)
 
-	# Evaluate the conversion based on command line parameters
-	eval (args.from_key[0] + '.' + args.to_key[0] + '(' + params + ')')
+	# Run the conversion based on command line parameters
+	convert = getattr(formats[args.from_key[0]], args.to_key[0], None)
+	if convert is None:
+		print ("Error: " + args.from_key[0] + " to " + args.to_key[0] +
+			" conversion is not supported.")
+		exit(0)
+	unsupported = unsupported_options(convert, options)
+	if unsupported:
+		print ("Error: " + ", ".join(unsupported) + " not supported for " +
+			args.from_key[0] + " to " + args.to_key[0] + " conversion.")
+		exit(0)
+	convert(args.from_path[0], args.to_path[0],
+		args.label[0] if args.label else None, **options)
 
 	print ("Conversion complete!!")
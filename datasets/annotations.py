@@ -0,0 +1,346 @@
+###############################################################################
+##########                  Intermediate annotations                 ##########
+"""
+Every converter parses its source labels into an Annotations object before
+writing the target format.  Boxes are always kept in pixel coordinates
+(x1, y1, x2, y2); every other per-object attribute is an optional column in
+'fields' holding NaN where the value is unknown.
+
+Fields carried from KITTI:
+
+    truncated    Float from 0 (non-truncated) to 1 (truncated)
+    occluded     Integer (0,1,2,3) occlusion state
+    alpha        Observation angle of object [-pi..pi]
+    height, width, length
+                 3D object dimensions (in meters)
+    x, y, z      3D object location in camera coordinates (in meters)
+    rotation_y   Rotation ry around Y-axis [-pi..pi]
+    score        Detection confidence (results only)
+
+Formats which cannot express a field (YOLO has none of them, VOC only has
+boolean truncated/occluded flags) keep it in a sidecar file next to the
+labels of each split ('<split>/sidecar.jsonl').  Each line holds the fields
+for one label file:
+
+    {"file": "000042", "fields": {"truncated": [0.0, 0.5], ...}}
+
+Reading the sidecar back when converting to KITTI makes a round trip such as
+KITTI -> YOLO -> KITTI lossless.
+"""
+###############################################################################
+
+# Import necessary libraries
+import os, json, array, struct, hashlib
+import numpy as np
+
+KITTI_FIELDS = ['truncated', 'occluded', 'alpha', 'height', 'width', 'length',
+	'x', 'y', 'z', 'rotation_y', 'score']
+
+SIDECAR = "sidecar.jsonl"
+
+class Annotations(object):
+	"""
+	Definition: Objects of a single image in the intermediate format.
+
+	Parameters: names - class names of objects (None where not known yet)
+				boxes - (N, 4) pixel coordinates (x1, y1, x2, y2)
+				classes - class indices of objects (or None)
+				fields - dictionary of optional per-object columns
+	"""
+	def __init__(self, names, boxes, classes=None, fields=None):
+		self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+		if names is None:
+			names = [None] * len(self.boxes)
+		self.names = np.array(list(names) + [None], dtype=object)[:-1]
+		self.classes = classes
+		self.fields = fields if fields is not None else {}
+
+	def __len__(self):
+		return len(self.boxes)
+
+	def select(self, mask):
+		"""
+		Definition: Keep a subset of the objects.
+
+		Parameters: mask - boolean mask (or index array) of objects to keep
+		Returns: Annotations with only the selected objects
+		"""
+		classes = self.classes[mask] if self.classes is not None else None
+		fields = dict((k, v[mask]) for k, v in self.fields.items())
+		return Annotations(self.names[mask], self.boxes[mask], classes, fields)
+
+	def get(self, field, default=0.0):
+		"""
+		Definition: Get a field column with unknown values filled in.
+
+		Parameters: field - name of the field
+					default - value used where the field is unknown
+		Returns: array with one value per object
+		"""
+		if field not in self.fields:
+			return np.full(len(self), default, dtype=np.float64)
+		values = np.asarray(self.fields[field], dtype=np.float64)
+		return np.where(np.isnan(values), default, values)
+
+	def merge(self, fields):
+		"""
+		Definition: Add columns (ex. from a sidecar) to the annotations.
+			Columns that do not match the number of objects are ignored.
+
+		Parameters: fields - dictionary of per-object columns
+		Returns: None
+		"""
+		for k, v in (fields or {}).items():
+			if len(v) == len(self):
+				self.fields[k] = v
+
+def _format(value):
+	"""
+	Definition: Format a number as short as possible without losing
+		precision (ex. 0 rather than 0.0, 587.01 rather than 587.0100).
+
+	Parameters: value - number to be formatted
+	Returns: string representation of value
+	"""
+	value = float(value)
+	if value == int(value):
+		return str(int(value))
+	return repr(value)
+
+###########################################################
+##########           KITTI label files           ##########
+###########################################################
+def read_kitti(label_file):
+	"""
+	Definition: Parse a KITTI label file (all columns) in one vectorized pass.
+
+	Parameters: label_file - file with KITTI label(s) inside
+	Returns: Annotations with every KITTI field that is present in the file
+	"""
+	with open(label_file) as lfile:
+		rows = [line.split() for line in lfile if line.strip()]
+	values = np.array([(l + ['nan'] * 16)[1:16] for l in rows],
+		dtype=np.float64).reshape(-1, 15)
+	columns = [0, 1, 2, 7, 8, 9, 10, 11, 12, 13, 14]
+	fields = {}
+	for name, col in zip(KITTI_FIELDS, columns):
+		if not np.isnan(values[:, col]).all():
+			fields[name] = values[:, col]
+	return Annotations([l[0] for l in rows], values[:, 3:7], fields=fields)
+
+def write_kitti(label_file, ann):
+	"""
+	Definition: Write annotations as a KITTI label file.  Unknown fields are
+		written as 0; the score column is only written where it is known.
+
+	Parameters: label_file - path to KITTI label file to be written
+				ann - Annotations to be written
+	Returns: None
+	"""
+	values = np.column_stack([ann.get('truncated'), ann.get('occluded'),
+		ann.get('alpha'), np.round(ann.boxes, 2)] +
+		[ann.get(f) for f in KITTI_FIELDS[3:10]])
+	score = ann.fields.get('score')
+	with open(label_file, "w") as kfile:
+		for i in range(len(ann)):
+			line = [str(ann.names[i])] + [_format(v) for v in values[i]]
+			if score is not None and not np.isnan(score[i]):
+				line.append(_format(score[i]))
+			kfile.write(" ".join(line) + "\n")
+
+###########################################################
+##########            YOLO label files           ##########
+###########################################################
+def read_yolo(label_file, img_width, img_height):
+	"""
+	Definition: Parse a YOLO label file and convert normalized
+		(x, y, width, height) to pixel (x1, y1, x2, y2).
+
+	Parameters: label_file - file with YOLO label(s) inside
+				img_width - width of image
+				img_height - height of image
+	Returns: Annotations with class indices (names are not resolved)
+	"""
+	with open(label_file) as lfile:
+		rows = [line.split() for line in lfile if line.strip()]
+	classes = np.array([int(l[0]) for l in rows], dtype=np.int64)
+	coords = np.array([l[1:5] for l in rows], dtype=np.float64).reshape(-1, 4)
+	x1 = float(img_width) * (2.0 * coords[:, 0] - coords[:, 2]) / 2.0
+	y1 = float(img_height) * (2.0 * coords[:, 1] - coords[:, 3]) / 2.0
+	x2 = float(img_width) * (2.0 * coords[:, 0] + coords[:, 2]) / 2.0
+	y2 = float(img_height) * (2.0 * coords[:, 1] + coords[:, 3]) / 2.0
+	return Annotations(None, np.stack([x1, y1, x2, y2], axis=1), classes)
+
+def to_yolo(boxes, img_width, img_height):
+	"""
+	Definition: Convert pixel (x1, y1, x2, y2) boxes to normalized
+		(x, y, width, height) YOLO boxes.
+
+	Parameters: boxes - (N, 4) array of pixel coordinates
+				img_width - width of image
+				img_height - height of image
+	Returns: (N, 4) array of normalized YOLO coordinates
+	"""
+	b = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+	x = (b[:, 2] + b[:, 0]) / 2.0 / float(img_width)
+	y = (b[:, 3] + b[:, 1]) / 2.0 / float(img_height)
+	width = (b[:, 2] - b[:, 0]) / float(img_width)
+	height = (b[:, 3] - b[:, 1]) / float(img_height)
+	return np.stack([x, y, width, height], axis=1)
+
+def write_yolo(label_file, ann, img_width, img_height):
+	"""
+	Definition: Write annotations as a YOLO label file, converting pixel
+		(x1, y1, x2, y2) to normalized (x, y, width, height).
+
+	Parameters: label_file - path to YOLO label file to be written
+				ann - Annotations (with class indices) to be written
+				img_width - width of image
+				img_height - height of image
+	Returns: None
+	"""
+	coords = to_yolo(ann.boxes, img_width, img_height).tolist()
+	with open(label_file, "w") as yfile:
+		for l, c in zip(ann.classes.tolist(), coords):
+			yfile.write(str(l) + " " + str(c[0]) + " " + str(c[1]) +
+				" " + str(c[2]) + " " + str(c[3]) + "\n")
+
+###########################################################
+##########            VOC attributes             ##########
+###########################################################
+def voc_attributes(fields, count):
+	"""
+	Definition: Derive the VOC difficult/occluded/truncated flags from the
+		annotation fields.  Unknown values fall back to the defaults used
+		so far (difficult=0, occluded=0, truncated=1).
+
+	Parameters: fields - dictionary of per-object columns
+				count - number of objects
+	Returns: difficult, occluded, truncated - lists of '0'/'1' strings
+	"""
+	def flags(name, known, default):
+		values = np.asarray(fields.get(name, np.full(count, np.nan)),
+			dtype=np.float64)
+		out = np.full(count, default, dtype=np.int64)
+		mask = ~np.isnan(values)
+		out[mask] = known(values[mask])
+		return [str(v) for v in out.tolist()]
+
+	fields = fields or {}
+	difficult = flags('difficult', lambda v: v > 0, 0)
+	occluded = flags('occluded', lambda v: (v > 0) & (v < 3), 0)
+	truncated = flags('truncated', lambda v: v > 0, 1)
+	return difficult, occluded, truncated
+
+###########################################################
+##########              Sidecar file             ##########
+###########################################################
+def write_sidecar(sfile, key, ann):
+	"""
+	Definition: Append the fields of one label file to an open sidecar.
+		Nothing is written when there are no fields to keep.
+
+	Parameters: sfile - sidecar file open for writing
+				key - name of label file without extension
+				ann - Annotations with fields to be kept
+	Returns: None
+	"""
+	if not ann.fields or not len(ann):
+		return
+	fields = {}
+	for k, v in ann.fields.items():
+		fields[k] = [None if np.isnan(x) else x
+			for x in np.asarray(v, dtype=np.float64).tolist()]
+	sfile.write(json.dumps({"file": key, "fields": fields}) + "\n")
+
+class OffsetIndex(object):
+	"""
+	Definition: Compact index of byte ranges in a file by integer key.
+		Entries are kept in flat arrays (24 bytes each) instead of a
+		dictionary, so indexing millions of entries stays small.  The index
+		is filled with add(), then sorted once with freeze() for lookups.
+
+	Parameters: None
+	"""
+	def __init__(self):
+		self.keys = array.array('q')
+		self.offsets = array.array('q')
+		self.lengths = array.array('q')
+
+	def add(self, key, offset, length):
+		self.keys.append(key)
+		self.offsets.append(offset)
+		self.lengths.append(length)
+
+	def freeze(self):
+		# Sort one column at a time, releasing each unsorted column as it
+		# goes, so freezing needs little more than the index itself
+		order = np.argsort(self._column('keys'), kind='mergesort')
+		for name in ['keys', 'offsets', 'lengths']:
+			setattr(self, name, self._column(name)[order])
+
+	def _column(self, name):
+		column = getattr(self, name)
+		if not len(column):
+			return np.zeros(0, dtype=np.int64)
+		return np.frombuffer(column, dtype=np.int64)
+
+	def find(self, key):
+		"""
+		Definition: Look up the byte ranges added for a key.
+
+		Parameters: key - integer key
+		Returns: list of (offset, length) tuples in the order they were added
+		"""
+		lo = np.searchsorted(self.keys, key, side='left')
+		hi = np.searchsorted(self.keys, key, side='right')
+		return list(zip(self.offsets[lo:hi].tolist(),
+			self.lengths[lo:hi].tolist()))
+
+	def __len__(self):
+		return len(self.keys)
+
+def _hash(key):
+	# 64-bit hash of a string key for OffsetIndex
+	return struct.unpack('<q', hashlib.md5(key.encode('utf-8')).digest()[:8])[0]
+
+class Sidecar(object):
+	"""
+	Definition: Read access to a sidecar file.  Only a hash of the key and
+		the byte range of each entry are kept in memory; entries are parsed
+		(and their key checked) on lookup.
+
+	Parameters: path - path to sidecar file (may not exist)
+	"""
+	def __init__(self, path):
+		self.index = OffsetIndex()
+		self.sfile = None
+		if os.path.isfile(path):
+			self.sfile = open(path, "rb")
+			offset = 0
+			for line in self.sfile:
+				key = json.loads(line.decode("utf-8"))["file"]
+				self.index.add(_hash(key), offset, len(line))
+				offset += len(line)
+		self.index.freeze()
+
+	def get(self, key):
+		"""
+		Definition: Look up the fields kept for one label file.  When a file
+			has several entries (ex. converted again in watch mode) the last
+			one is used.
+
+		Parameters: key - name of label file without extension
+		Returns: dictionary of per-object columns (empty if none were kept)
+		"""
+		for offset, length in reversed(self.index.find(_hash(key))):
+			self.sfile.seek(offset)
+			entry = json.loads(self.sfile.read(length).decode("utf-8"))
+			if entry["file"] == key:
+				return dict((k, np.array(v, dtype=np.float64))
+					for k, v in entry["fields"].items())
+		return {}
+
+	def close(self):
+		if self.sfile:
+			self.sfile.close()
@@ -0,0 +1,409 @@
+###############################################################################
+##########                        COCO format                        ##########
+"""
+Each split has a single JSON file ('<split>/annotations.json') next to its
+images ('<split>/images/'):
+
+    images         List of {id, file_name, width, height}
+    annotations    List of {id, image_id, category_id, bbox, area, iscrowd}
+                   where bbox is [x, y, width, height] in pixels.  KITTI
+                   fields are kept in an extra 'attributes' dictionary.
+    categories     List of {id, name}
+
+COCO files can be several GB, so they are never held in memory as a whole.
+CocoWriter streams images and annotations to disk as they are added and
+CocoReader parses the file incrementally, keeping only the byte offsets of
+the entries (indexed by image id, 24 bytes per entry) and reading entries
+back on lookup.
+"""
+###############################################################################
+
+# Import necessary libraries
+import os, sys, re, math, array, numbers, shutil, json, codecs, tempfile
+import numpy as np
+from PIL import Image
+
+from . import annotations, labelmap
+
+python_version = sys.version_info.major
+
+ANNOTATIONS = "annotations.json"
+
+# Bytes of a COCO file read at a time while parsing it
+CHUNK = 1 << 20
+
+###########################################################
+##########              COCO writer              ##########
+###########################################################
+class CocoWriter(object):
+	"""
+	Definition: Streams a COCO file to disk with constant memory.  Images
+		go straight to the output file, annotations to a temporary file
+		that is appended when the writer is closed.  Categories are
+		assigned ids as new class names show up.
+
+	Parameters: path - path to COCO file to be written
+				labels - optional list of class names (ids follow its order)
+	"""
+	def __init__(self, path, labels=None):
+		self.out = open(path, "w")
+		self.out.write('{"images": [')
+		self.tmp = tempfile.TemporaryFile(mode="w+",
+			dir=os.path.dirname(os.path.abspath(path)))
+		self.num_images = 0
+		self.num_annotations = 0
+		self.categories = {}
+		for name in labels or []:
+			self.category_id(name)
+
+	def category_id(self, name):
+		"""
+		Definition: Look up (or assign) the category id of a class name.
+
+		Parameters: name - class name
+		Returns: category id (1-based)
+		"""
+		if name not in self.categories:
+			self.categories[name] = len(self.categories) + 1
+		return self.categories[name]
+
+	def add_image(self, file_name, width, height):
+		"""
+		Definition: Append an image entry.
+
+		Parameters: file_name - image file name relative to the images dir
+					width - width of image
+					height - height of image
+		Returns: id of the image
+		"""
+		self.num_images += 1
+		entry = {"id": self.num_images, "file_name": file_name,
+			"width": int(width), "height": int(height)}
+		self.out.write(("," if self.num_images > 1 else "") + json.dumps(entry))
+		return self.num_images
+
+	def add_annotations(self, image_id, ann):
+		"""
+		Definition: Append the objects of one image.
+
+		Parameters: image_id - id returned by add_image
+					ann - Annotations with class names
+		Returns: None
+		"""
+		b = ann.boxes
+		bbox = np.stack([b[:, 0], b[:, 1], b[:, 2] - b[:, 0],
+			b[:, 3] - b[:, 1]], axis=1)
+		area = (bbox[:, 2] * bbox[:, 3]).tolist()
+		fields = [(k, np.asarray(v, dtype=np.float64).tolist())
+			for k, v in sorted(ann.fields.items())]
+		for i, box in enumerate(bbox.tolist()):
+			self.num_annotations += 1
+			entry = {"id": self.num_annotations, "image_id": image_id,
+				"category_id": self.category_id(str(ann.names[i])),
+				"bbox": box, "area": area[i], "iscrowd": 0}
+			attributes = dict((k, v[i]) for k, v in fields
+				if not math.isnan(v[i]))
+			if attributes:
+				entry["attributes"] = attributes
+			self.tmp.write(("," if self.num_annotations > 1 else "") +
+				json.dumps(entry))
+
+	def close(self):
+		self.out.write('], "annotations": [')
+		self.tmp.seek(0)
+		shutil.copyfileobj(self.tmp, self.out)
+		self.tmp.close()
+		categories = [{"id": i, "name": name} for name, i in
+			sorted(self.categories.items(), key=lambda c: c[1])]
+		self.out.write('], "categories": ' + json.dumps(categories) + '}')
+		self.out.close()
+
+###########################################################
+##########              COCO reader              ##########
+###########################################################
+class _Stream(object):
+	"""
+	Definition: Incremental JSON tokenizer over a file.  Only a small
+		window of the file is held in memory and the byte offset of every
+		decoded value is tracked so it can be read back later with a seek.
+
+	Parameters: f - file open in binary mode
+				chunk - number of bytes read at a time
+	"""
+	whitespace = re.compile(r'[ \t\r\n]*')
+	continues = '0123456789.eE+-'
+
+	def __init__(self, f, chunk=1 << 20):
+		self.f = f
+		self.chunk = chunk
+		self.decoder = codecs.getincrementaldecoder('utf-8')()
+		self.json = json.JSONDecoder()
+		self.buf = u''
+		self.pos = 0
+		self.byte = 0
+		self.eof = False
+
+	def _fill(self):
+		# Drop the consumed part of the window and read the next chunk
+		self.buf = self.buf[self.pos:]
+		self.pos = 0
+		data = self.f.read(self.chunk)
+		if not data:
+			self.eof = True
+			return False
+		self.buf += self.decoder.decode(data)
+		return True
+
+	def peek(self):
+		"""
+		Definition: Skip whitespace and return the next character.
+
+		Parameters: None
+		Returns: next character ('' at end of file)
+		"""
+		while True:
+			end = self.whitespace.match(self.buf, self.pos).end()
+			self.byte += end - self.pos
+			self.pos = end
+			if self.pos < len(self.buf) or not self._fill():
+				return self.buf[self.pos:self.pos + 1]
+
+	def expect(self, chars):
+		"""
+		Definition: Consume the next character, which must be in chars.
+
+		Parameters: chars - allowed characters
+		Returns: consumed character
+		"""
+		c = self.peek()
+		if not c or c not in chars:
+			raise ValueError("Expected %r at byte %d, found %r" %
+				(chars, self.byte, c))
+		self.pos += 1
+		self.byte += 1
+		return c
+
+	@staticmethod
+	def _number(value):
+		return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+	def value(self):
+		"""
+		Definition: Decode the next JSON value.
+
+		Parameters: None
+		Returns: value - decoded value
+				 offset - byte offset of the value in the file
+				 length - length of the value in bytes
+		"""
+		self.peek()
+		while True:
+			try:
+				value, end = self.json.raw_decode(self.buf, self.pos)
+				# A number cut at the end of the window (ex. '1.' of '1.25')
+				# may continue in the file
+				if self.eof or (end < len(self.buf) and not (
+					self._number(value) and self.buf[end] in self.continues)):
+					break
+			except ValueError:
+				if self.eof:
+					raise
+			self._fill()
+		offset = self.byte
+		length = len(self.buf[self.pos:end].encode('utf-8'))
+		self.pos = end
+		self.byte += length
+		return value, offset, length
+
+class CocoReader(object):
+	"""
+	Definition: Incremental reader for a COCO file.  One pass over the file
+		builds an image id -> annotation offset index; images and
+		annotations are then read back with a seek on lookup.  Categories
+		are small and kept in memory.
+
+	Parameters: path - path to COCO file
+	"""
+	def __init__(self, path):
+		self.f = open(path, "rb")
+		self.image_ids = array.array('q')
+		self.images = annotations.OffsetIndex()
+		self.index = annotations.OffsetIndex()
+		self.categories = {}
+
+		stream = _Stream(self.f, CHUNK)
+		stream.expect('{')
+		while stream.peek() != '}':
+			key = stream.value()[0]
+			stream.expect(':')
+			if key in ('images', 'annotations', 'categories') and \
+				stream.peek() == '[':
+				stream.expect('[')
+				while stream.peek() != ']':
+					entry, offset, length = stream.value()
+					self._add(key, entry, offset, length)
+					if stream.expect(',]') == ']':
+						break
+				else:
+					stream.expect(']')
+			else:
+				stream.value()
+			if stream.expect(',}') == '}':
+				break
+		self.images.freeze()
+		self.index.freeze()
+
+	def _add(self, key, entry, offset, length):
+		if key == 'images':
+			self.image_ids.append(entry['id'])
+			self.images.add(entry['id'], offset, length)
+		elif key == 'annotations':
+			self.index.add(entry['image_id'], offset, length)
+		else:
+			self.categories[entry['id']] = entry['name']
+
+	def _read(self, offset, length):
+		self.f.seek(offset)
+		return json.loads(self.f.read(length).decode('utf-8'))
+
+	def image(self, image_id):
+		"""
+		Definition: Read the entry of one image.
+
+		Parameters: image_id - id of image
+		Returns: dictionary with id, file_name, width and height
+		"""
+		return self._read(*self.images.find(image_id)[0])
+
+	def annotations(self, image_id):
+		"""
+		Definition: Read the objects of one image.
+
+		Parameters: image_id - id of image
+		Returns: Annotations with class names and KITTI fields (if any)
+		"""
+		entries = [self._read(o, l) for o, l in self.index.find(image_id)]
+		bbox = np.array([e['bbox'] for e in entries],
+			dtype=np.float64).reshape(-1, 4)
+		boxes = np.stack([bbox[:, 0], bbox[:, 1], bbox[:, 0] + bbox[:, 2],
+			bbox[:, 1] + bbox[:, 3]], axis=1)
+		names = [self.categories.get(e['category_id'], str(e['category_id']))
+			for e in entries]
+		fields = {}
+		for i, e in enumerate(entries):
+			for k, v in e.get('attributes', {}).items():
+				if k not in fields:
+					fields[k] = np.full(len(entries), np.nan)
+				fields[k][i] = v
+		return annotations.Annotations(names, boxes, fields=fields)
+
+	def close(self):
+		self.f.close()
+
+def make_directories(dataset, labels=True):
+	"""
+	Definition: Make directories for images (and labels) of a dataset.
+		Removes previously created image and label directories.
+
+	Parameters: dataset - path to {coco, kitti, yolo} directory to be created
+				labels - also make the per-split labels directories
+	Returns: None
+	"""
+	if os.path.exists(dataset):
+		if python_version == 3:
+			prompt = input('Directory already exists. Overwrite? (yes, no): ')
+		else:
+			prompt = raw_input('Directory already exists. Overwrite? (yes, no): ')
+		if prompt == 'no':
+			exit(0)
+		shutil.rmtree(dataset)
+	os.makedirs(dataset)
+	for split in ["train", "val"]:
+		os.makedirs(dataset + split + "/images")
+		if labels:
+			os.makedirs(dataset + split + "/labels")
+
+def copy_image(src, dst, fmt):
+	"""
+	Definition: Copy an image, transcoding it when the target format
+		needs a different file type.
+
+	Parameters: src - path to source image
+				dst - path to target image (extension decides the type)
+				fmt - PIL format of the target ('png' or 'jpeg')
+	Returns: None
+	"""
+	if os.path.splitext(src)[1].lower() == os.path.splitext(dst)[1].lower():
+		shutil.copy(src, dst)
+		return
+	im = Image.open(src)
+	if fmt == 'jpeg' and im.mode not in ('RGB', 'L'):
+		im = im.convert('RGB')
+	im.save(dst, fmt)
+	im.close()
+
+###########################################################
+##########        COCO to KITTI Conversion       ##########
+###########################################################
+def kitti(coco_dir, kitti_dir, label=None, label_map=None):
+	print ("Converting coco to kitti")
+
+	# Build optional class remapping (KITTI is name based)
+	lmap = labelmap.load(None, label_map)
+
+	# Make all directories for kitti dataset
+	make_directories(kitti_dir)
+
+	# Read each split's COCO file incrementally, one image at a time
+	for split in ["train", "val"]:
+		reader = CocoReader(coco_dir + split + "/" + ANNOTATIONS)
+		for image_id in reader.image_ids:
+			image = reader.image(image_id)
+			key = os.path.splitext(os.path.basename(image['file_name']))[0]
+			src = coco_dir + split + "/images/" + image['file_name']
+			if not os.path.isfile(src):
+				continue
+			ann = reader.annotations(image_id)
+			ann.names, keep = lmap.rename(ann.names)
+			annotations.write_kitti(kitti_dir + split + "/labels/" + key + ".txt",
+				ann.select(keep))
+			copy_image(src, kitti_dir + split + "/images/" + key + ".png", "png")
+		reader.close()
+
+###########################################################
+##########        COCO to YOLO Conversion        ##########
+###########################################################
+def yolo(coco_dir, yolo_dir, label=None, label_map=None):
+	print ("Converting coco to yolo")
+
+	# Build class index (and optional remapping) from label file
+	lmap = labelmap.load(label, label_map)
+
+	# Make all directories for yolo dataset
+	make_directories(yolo_dir)
+
+	# Read each split's COCO file incrementally, one image at a time.  Image
+	# sizes come from the COCO file, so images are only decoded to transcode.
+	for split in ["train", "val"]:
+		reader = CocoReader(coco_dir + split + "/" + ANNOTATIONS)
+		sfile = open(yolo_dir + split + "/" + annotations.SIDECAR, "w")
+		f_list = open(yolo_dir + split + ".txt", "w")
+		for image_id in reader.image_ids:
+			image = reader.image(image_id)
+			key = os.path.splitext(os.path.basename(image['file_name']))[0]
+			src = coco_dir + split + "/images/" + image['file_name']
+			if not os.path.isfile(src):
+				continue
+			ann = reader.annotations(image_id)
+			ann.classes, keep = lmap.encode(ann.names)
+			ann = ann.select(keep)
+			annotations.write_yolo(yolo_dir + split + "/labels/" + key + ".txt",
+				ann, image['width'], image['height'])
+			annotations.write_sidecar(sfile, key, ann)
+			yolo_image = yolo_dir + split + "/images/" + key + ".jpg"
+			copy_image(src, yolo_image, "jpeg")
+			f_list.write('%s\n' % (yolo_image))
+		reader.close()
+		sfile.close()
+		f_list.close()
+	lmap.report()
@@ -0,0 +1,117 @@
+###############################################################################
+##########                   Fanned-out output layout                ##########
+"""
+Output trees with millions of samples get slow with every file of a split in
+one flat 'images' or 'labels' directory.  A layout (mode, levels) spreads
+the files over nested subdirectories instead, two characters per level:
+
+    hash      levels of a crc32 hash of the name, 256-way per level
+              ('train/images/3f/a0/000042.jpg' with 2 levels)
+    prefix    the leading characters of the name, which suits names that
+              are already hashes or uuids ('train/images/9b/e4/9be4c1.jpg')
+
+The image and label of a sample always share the same subdirectory, and
+train.txt/val.txt list the full image paths.  Readers walk a directory
+recursively (walk), so flat and fanned-out trees are read the same way.
+"""
+###############################################################################
+
+# Import necessary libraries
+import os, zlib
+from multiprocessing.pool import ThreadPool
+
+MODES = ['hash', 'prefix']
+
+def subdir(layout, key):
+	"""
+	Definition: Subdirectory of a sample in the layout.
+
+	Parameters: layout - (mode, levels) tuple, or None (flat)
+				key - name of the sample (file name without extension)
+	Returns: relative path ending in '/' ('' for a flat layout)
+	"""
+	if layout is None:
+		return ""
+	mode, levels = layout
+	if mode == 'hash':
+		name = "%08x" % (zlib.crc32(key.encode('utf-8')) & 0xffffffff)
+	else:
+		name = key.ljust(2 * levels, '_')
+	return "".join(name[2 * i:2 * i + 2] + "/" for i in range(levels))
+
+def make_directories(split_dir, layout, keys, jobs=16):
+	"""
+	Definition: Make the image and label subdirectories needed by a set of
+		samples up front, in parallel.  Existing directories are kept.
+
+	Parameters: split_dir - path to output split ('yolo/train/')
+				layout - (mode, levels) tuple, or None (flat)
+				keys - names of the samples that will be written
+				jobs - number of threads creating directories
+	Returns: None
+	"""
+	if layout is None:
+		return
+	subdirs = set(subdir(layout, key) for key in keys)
+	paths = [split_dir + kind + "/" + s for s in subdirs
+		for kind in ["images", "labels"]]
+
+	def make(path):
+		try:
+			os.makedirs(path)
+		except OSError:
+			if not os.path.isdir(path):
+				raise
+
+	pool = ThreadPool(jobs)
+	try:
+		pool.map(make, paths, chunksize=64)
+	finally:
+		pool.close()
+		pool.join()
+
+def walk(path):
+	"""
+	Definition: Iterate over the files of a flat or fanned-out directory.
+		Entries are streamed from the file system, so memory does not grow
+		with the number of files.
+
+	Parameters: path - directory to be walked
+	Returns: generator of (name without extension, subdirectory relative to
+		path ending in '/' or '', file name) tuples
+	"""
+	if not os.path.isdir(path):
+		return
+	pending = [""]
+	while pending:
+		sub = pending.pop()
+		for name, is_dir in _entries(path + sub):
+			if is_dir:
+				pending.append(sub + name + "/")
+			else:
+				yield os.path.splitext(name)[0], sub, name
+
+def _entries(path):
+	# Stream (name, is directory) entries, with os.scandir where available
+	if not hasattr(os, 'scandir'):
+		for name in os.listdir(path):
+			yield name, os.path.isdir(os.path.join(path, name))
+		return
+	it = os.scandir(path)
+	try:
+		for entry in it:
+			yield entry.name, entry.is_dir()
+	finally:
+		if hasattr(it, 'close'):
+			it.close()
+
+def index_dir(path):
+	"""
+	Definition: Index the files of a flat or fanned-out directory by name
+		without extension (for random access, ex. by the loader).
+
+	Parameters: path - directory to be indexed
+	Returns: dictionary of file name without extension to file path
+		relative to the directory
+	"""
+	return dict((key, sub + name) for key, sub, name in walk(path))
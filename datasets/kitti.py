@@ -23,94 +23,135 @@ Values    Name      Description
 ###############################################################################
 
 # Import necessary libraries
-import os, sys, shutil, glob, argparse
+import os, sys, shutil, glob, argparse, multiprocessing
 import numpy as np
+from multiprocessing.pool import ThreadPool
 from PIL import Image
 from lxml import etree
 
+from . import annotations, labelmap, transform
+from . import fanout, sharding
+from . import coco as datasets_coco
+
 python_version = sys.version_info.major
 
 ###########################################################
 ##########        KITTI to YOLO Conversion       ##########
 ###########################################################
-def determine_label_yolo(label, labels):
-	"""
-	Definition: Converts label to index in label set
-
-	Parameters: label - label from file
-				labels - list of labels
-	Returns: index of label in labels (in str format)
-	"""
-	return str(labels.index(label))
-
-def parse_labels_yolo(label_file, labels, img_width, img_height):
+def parse_labels_yolo(label_file, label_map):
 	"""
-	Definition: Parses label files to extract label and bounding box
-		coordinates.  Converts (x1, y1, x1, y2) KITTI format to
-		(x, y, width, height) normalized YOLO format.
+	Definition: Parses label files to extract label, bounding box
+		coordinates and every other KITTI field.  Objects whose class is
+		dropped by the label map (or missing from the label file) are
+		filtered out here, before anything is written.
 
 	Parameters: label_file - file with KITTI label(s) inside
-				labels - list of labels in dataset
-				img_width - width of input image
-				img_height - height of input image
-	Return: all_labels - contains a list of labels for objects in image
-			all_coords - contains a list of coordinate for objects in image
-	"""
-	lfile = open(label_file)
-	coords = []
-	all_coords = []
-	all_labels = []
-	for line in lfile:
-		l = line.split(" ")
-		all_labels.append(determine_label_yolo(l[0], labels))
-		coords = list(map(int, list(map(float, l[4:8]))))
-		x = float((float(coords[2]) + float(coords[0])) / 2.0) / float(img_width)
-		y = float((float(coords[3]) + float(coords[1])) / 2.0) / float(img_height)
-		width = float(float(coords[2]) - float(coords[0])) / float(img_width)
-		height = float(float(coords[3]) - float(coords[1])) / float(img_height)
-		tmp = [x, y, width, height]
-		all_coords.append(tmp)
-	lfile.close()
-	return all_labels, all_coords
-
-def copy_images_yolo(kitti, yolo):
+				label_map - LabelMap built from the label file
+	Return: Annotations with class indices set for the YOLO label file
 	"""
-	Definition: Copy all images from the training and validation image sets
-		in kitti format to training and validation image sets in yolo format.
-		This means converting from .png to .jpg
+	ann = annotations.read_kitti(label_file)
+	ann.classes, keep = label_map.encode(ann.names)
+	return ann.select(keep)
 
-	Parameters: kitti - path to kitti directory (contains 'train' and 'val')
-				yolo - path to yolo output directory
-	Returns: None
+def convert_sample_yolo(image_file, label_file, yolo_image, yolo_label,
+	label_map, resize=None, keep_aspect=False, pad_value=0):
 	"""
-	for filename in glob.glob(os.path.join(kitti + "train/images/", "*.*")):
-		shutil.copy(filename, yolo + "train/images/")
-	for filename in glob.glob(os.path.join(kitti + "val/images/", "*.*")):
-		shutil.copy(filename, yolo + "val/images/")
-
-	for filename in glob.glob(os.path.join(yolo + "train/images", "*.*")):
-		im = Image.open(filename)
-		im.save(filename.split(".png")[0] + ".jpg", "jpeg")
-		os.remove(filename)
-	for filename in glob.glob(os.path.join(yolo + "val/images", "*.*")):
-		im = Image.open(filename)
-		im.save(filename.split(".png")[0] + ".jpg", "jpeg")
-		os.remove(filename)
-
-def write_txt_files_yolo(yolo, f_train, f_val):
+	Definition: Convert one kitti sample to yolo.  The image is decoded
+		once, optionally resized/letterboxed and encoded once as .jpg; the
+		boxes are adjusted with the same transform before being written.
+
+	Parameters: image_file - path to kitti image
+				label_file - path to kitti label file (or None if missing)
+				yolo_image - path to yolo image to be written
+				yolo_label - path to yolo label file to be written
+				label_map - LabelMap built from the label file
+				resize - (width, height) of output images, or None
+				keep_aspect - keep aspect ratio and pad (letterbox)
+				pad_value - gray level used for letterbox padding
+	Returns: Annotations written for the sample (None without label file)
 	"""
-	Definition: Fill in a text file containing a list of all images in the
-		training and validation sets.
-
-	Parameters: yolo - path to yolo dataset directory (contains 'train' and 'val')
-				f_train - file open for adding training examples
-				f_val - file open for adding validation examples
-	Returns: None
+	img, w, h = transform.open_image(image_file, resize, keep_aspect)
+	ann = parse_labels_yolo(label_file, label_map) if label_file else None
+	if resize:
+		img, params = transform.resize_image(img, w, h, resize, keep_aspect,
+			pad_value)
+		w, h = img.size
+		if ann is not None:
+			ann.boxes = transform.transform_boxes(ann.boxes, *params)
+	elif img.mode not in ('RGB', 'L'):
+		img = img.convert('RGB')
+	img.save(yolo_image, "jpeg")
+	img.close()
+	if ann is not None:
+		annotations.write_yolo(yolo_label, ann, w, h)
+	return ann
+
+def convert_sample_tiles_yolo(image_file, label_file, yolo_split, key,
+	label_map, tile, tile_overlap=0, min_visibility=0.25, resize=None,
+	keep_aspect=False, pad_value=0, pool=None, subdir=""):
 	"""
-	for filename in glob.glob(os.path.join(yolo + "train/images/", "*.*")):
-		f_train.write('%s\n' % (filename))
-	for filename in glob.glob(os.path.join(yolo + "val/images/", "*.*")):
-		f_val.write('%s\n' % (filename))
+	Definition: Convert one kitti sample to overlapping yolo tiles.  The
+		image is decoded once; boxes are clipped and assigned to every tile
+		in one vectorized pass (boxes less visible than min_visibility in a
+		tile are dropped from it) and the tiles are encoded in parallel.
+		Tiles are named '<name>_<x>_<y>' after their top left corner.
+
+	Parameters: image_file - path to kitti image
+				label_file - path to kitti label file (or None if missing)
+				yolo_split - path to yolo split directory (ex. 'yolo/train/')
+				key - name of the sample (image name without extension)
+				label_map - LabelMap built from the label file
+				tile - (width, height) of tiles
+				tile_overlap - overlap between neighbouring tiles (in pixels)
+				min_visibility - fraction of a box that must be in a tile
+				resize, keep_aspect, pad_value - optional resize of each tile
+					(see convert_sample_yolo)
+				pool - thread pool used to encode the tiles (or None)
+				subdir - fanned-out subdirectory of the sample (or '')
+	Returns: list of (tile name, yolo image, Annotations or None) per tile
+	"""
+	img = Image.open(image_file)
+	w, h = img.size
+	if img.mode not in ('RGB', 'L'):
+		img = img.convert('RGB')
+	img.load()
+	ann = parse_labels_yolo(label_file, label_map) if label_file else None
+	tiles = transform.tile_grid(w, h, tile, tile_overlap)
+	if ann is not None:
+		keep, local, visibility = transform.tile_boxes(ann.boxes, tiles,
+			min_visibility)
+
+	def write_tile(t):
+		x1, y1, x2, y2 = [int(v) for v in tiles[t]]
+		tile_key = "%s_%d_%d" % (key, x1, y1)
+		yolo_image = yolo_split + "images/" + subdir + tile_key + ".jpg"
+		crop = img.crop((x1, y1, x2, y2))
+		tw, th = crop.size
+		tile_ann = None
+		if ann is not None:
+			tile_ann = ann.select(keep[t])
+			tile_ann.boxes = local[t][keep[t]]
+			# Clipping by the tile border truncates the object
+			tile_ann.fields['truncated'] = np.maximum(tile_ann.get('truncated'),
+				1.0 - visibility[t][keep[t]])
+		if resize:
+			crop, params = transform.resize_image(crop, tw, th, resize,
+				keep_aspect, pad_value)
+			tw, th = crop.size
+			if tile_ann is not None:
+				tile_ann.boxes = transform.transform_boxes(tile_ann.boxes, *params)
+		crop.save(yolo_image, "jpeg")
+		if tile_ann is not None:
+			annotations.write_yolo(yolo_split + "labels/" + subdir + tile_key +
+				".txt", tile_ann, tw, th)
+		return tile_key, yolo_image, tile_ann
+
+	if pool is not None:
+		results = pool.map(write_tile, range(len(tiles)))
+	else:
+		results = [write_tile(t) for t in range(len(tiles))]
+	img.close()
+	return results
 
 def make_yolo_directories(yolo):
 	"""
@@ -136,61 +177,77 @@ def make_yolo_directories(yolo):
 	os.makedirs(yolo + "val/images")
 	os.makedirs(yolo + "val/labels")
 
-def yolo(kitti_dir, yolo_dir, label=None):
+def yolo(kitti_dir, yolo_dir, label=None, label_map=None, resize=None,
+	keep_aspect=False, pad_value=0, shard=None, tile=None, tile_overlap=0,
+	min_visibility=0.25, layout=None):
 	print ("Converting kitti to yolo")
 
-	# Split label file
-	label_file = open(label)
-	labels_split = label_file.read().split('\n')
-
-	# Make all directories for yolo dataset
-	make_yolo_directories(yolo_dir)
-
-	# Iterate through kitti training data
-	for f in os.listdir(kitti_dir + "train/labels/"):
-		fname = (kitti_dir + "train/images/" + f).split(".txt")[0] + ".png"
-		if os.path.isfile(fname):
-			img = Image.open(fname)
-			w, h = img.size
-			img.close()
-			labels, coords = parse_labels_yolo(os.path.join(kitti_dir +
-				"train/labels/" + f), labels_split, w, h)
-			yolof = open(yolo_dir + "train/labels/" + f, "a+")
-			for l, c in zip(labels, coords):
-				yolof.write(l + " " + str(c[0]) + " " + str(c[1]) +
-					" " + str(c[2]) + " " + str(c[3]) + "\n")
-			yolof.close()
-
-	# Iterate through kitti validation data
-	for f in os.listdir(kitti_dir + "val/labels/"):
-		fname = (kitti_dir + "val/images/" + f).split(".txt")[0] + ".png"
-		if os.path.isfile(fname):
-			img = Image.open(fname)
-			w, h = img.size
-			img.close()
-			labels, coords = parse_labels_yolo(os.path.join(kitti_dir +
-				"val/labels/" + f), labels_split, w, h)
-			yolof = open(yolo_dir + "val/labels/" + f, "a+")
-			for l, c in zip(labels, coords):
-				yolof.write(l + " " + str(c[0]) + " " + str(c[1]) +
-					" " + str(c[2]) + " " + str(c[3]) + "\n")
-			yolof.close()
-
-	# Copy images from kitti to yolo
-	copy_images_yolo(kitti_dir, yolo_dir)
-
-	# Create train.txt and val.txt and populate them
-	f_train = open(yolo_dir + "train.txt", "a")
-	f_val = open(yolo_dir + "val.txt", "a")
-	write_txt_files_yolo(yolo_dir, f_train, f_val)
-	f_train.close()
-	f_val.close()
+	# Build class index (and optional remapping) from label file
+	lmap = labelmap.load(label, label_map)
+
+	# Make all directories for yolo dataset (a shard only adds to them)
+	if shard:
+		sharding.make_directories(yolo_dir, shard)
+	else:
+		make_yolo_directories(yolo_dir)
+	meta_dir = sharding.shard_dir(yolo_dir, shard)
+
+	# Tiles of an image are encoded in parallel threads
+	pool = ThreadPool(multiprocessing.cpu_count()) if tile else None
+
+	# Convert kitti training and validation data one sample at a time (image
+	# transcode and labels in the same pass), keeping the fields the target
+	# format cannot express in a sidecar next to the labels.  train.txt and
+	# val.txt are filled in as the images are written.
+	samples = {}
+	try:
+		for split in ["train", "val"]:
+			images_dir = kitti_dir + split + "/images/"
+			fanout.make_directories(yolo_dir + split + "/", layout,
+				(key for key, rel, f in fanout.walk(images_dir)
+					if sharding.owns(shard, split + "/" + key)))
+			sfile = open(meta_dir + split + "/" + annotations.SIDECAR, "w")
+			f_list = open(meta_dir + split + ".txt", "w")
+			samples[split] = 0
+			for key, rel, f in fanout.walk(images_dir):
+				if not sharding.owns(shard, split + "/" + key):
+					continue
+				image_file = images_dir + rel + f
+				label_file = kitti_dir + split + "/labels/" + rel + key + ".txt"
+				if not os.path.isfile(label_file):
+					label_file = None
+				sub = fanout.subdir(layout, key)
+				if tile:
+					results = convert_sample_tiles_yolo(image_file, label_file,
+						yolo_dir + split + "/", key, lmap, tile, tile_overlap,
+						min_visibility, resize, keep_aspect, pad_value, pool, sub)
+				else:
+					yolo_image = yolo_dir + split + "/images/" + sub + key + ".jpg"
+					results = [(key, yolo_image, convert_sample_yolo(image_file,
+						label_file, yolo_image,
+						yolo_dir + split + "/labels/" + sub + key + ".txt",
+						lmap, resize, keep_aspect, pad_value))]
+				for name, yolo_image, ann in results:
+					if ann is not None:
+						annotations.write_sidecar(sfile, name, ann)
+					f_list.write('%s\n' % (yolo_image))
+					samples[split] += 1
+			sfile.close()
+			f_list.close()
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+	lmap.report()
+
+	if shard:
+		sharding.write_manifest(yolo_dir, shard, samples)
 
 
 ###########################################################
 ##########        KITTI to VOC Conversion        ##########
 ###########################################################
-def write_voc_file(fname, labels, coords, img_width, img_height):
+def write_voc_file(fname, labels, coords, img_width, img_height, fields=None):
 	"""
 	Definition: Writes label into VOC (XML) format.
 
@@ -199,8 +256,12 @@ def write_voc_file(fname, labels, coords, img_width, img_height):
 				coords - list of position of objects in file
 				img_width - width of image
 				img_height - height of image
+				fields - optional per-object annotation fields used for the
+					difficult, occluded and truncated flags
 	Returns: annotation - XML tree for image file
 	"""
+	difficult_flags, occluded_flags, truncated_flags = \
+		annotations.voc_attributes(fields, len(coords))
 	annotation = etree.Element('annotation')
 	filename = etree.Element('filename')
 	f = fname.split("/")
@@ -230,16 +291,16 @@ def write_voc_file(fname, labels, coords, img_width, img_height):
 		ymin.text = str(coords[i][1])
 		bndbox.append(ymin)
 		difficult = etree.Element('difficult')
-		difficult.text = '0'
+		difficult.text = difficult_flags[i]
 		object.append(difficult)
 		occluded = etree.Element('occluded')
-		occluded.text = '0'
+		occluded.text = occluded_flags[i]
 		object.append(occluded)
 		pose = etree.Element('pose')
 		pose.text = 'Unspecified'
 		object.append(pose)
 		truncated = etree.Element('truncated')
-		truncated.text = '1'
+		truncated.text = truncated_flags[i]
 		object.append(truncated)
 	img_size = etree.Element('size')
 	annotation.append(img_size)
@@ -255,33 +316,21 @@ def write_voc_file(fname, labels, coords, img_width, img_height):
 
 	return annotation
 
-def parse_labels_voc(label_file):
+def parse_labels_voc(label_file, label_map):
 	"""
-	Definition: Parses label file to extract label and bounding box
-		coordintates.
+	Definition: Parses label file to extract label, bounding box
+		coordintates and every other KITTI field.  Objects whose class is
+		dropped by the label map are filtered out here.
 
 	Parameters: label_file - list of labels in images
-	Returns: all_labels - contains a list of labels for objects in the image
-			 all_coords - contains a list of coordinates for objects in image
+				label_map - LabelMap used to rename/drop classes
+	Returns: Annotations with the (renamed) class names
 	"""
-	lfile = open(label_file)
-	coords = []
-	all_coords = []
-	all_labels = []
-	for line in lfile:
-		l = line.split(" ")
-		all_labels.append(l[0])
-		coords = list(map(int, list(map(float, l[4:8]))))
-		xmin = coords[0]
-		ymin = coords[1]
-		xmax = coords[2]
-		ymax = coords[3]
-		tmp = [xmin, ymin, xmax, ymax]
-		all_coords.append(list(map(int, tmp)))
-	lfile.close()
-	return all_labels, all_coords
-
-def copy_images_voc(kitti, voc):
+	ann = annotations.read_kitti(label_file)
+	ann.names, keep = label_map.rename(ann.names)
+	return ann.select(keep)
+
+def copy_images_voc(kitti, voc, shard=None, layout=None):
 	"""
 	Definition: Copy all images from the training and validation sets
 		in kitti format to training and validation image sets in voc
@@ -289,12 +338,20 @@ def copy_images_voc(kitti, voc):
 
 	Parameters: kitti - path to kitti directory (contains 'train' and 'val')
 				voc - path to voc output directory
+				shard - (index, num_shards) to only copy the images of one
+					shard, or None
+				layout - (mode, levels) fan-out of the output, or None
 	Returns: None
 	"""
-	for filename in glob.glob(os.path.join(kitti + "train/images/", "*.*")):
-		shutil.copy(filename, voc + "train/images/")
-	for filename in glob.glob(os.path.join(kitti + "val/images/", "*.*")):
-		shutil.copy(filename, voc + "val/images/")
+	for split in ["train", "val"]:
+		images_dir = kitti + split + "/images/"
+		fanout.make_directories(voc + split + "/", layout,
+			(key for key, rel, f in fanout.walk(images_dir)
+				if sharding.owns(shard, split + "/" + key)))
+		for key, rel, f in fanout.walk(images_dir):
+			if sharding.owns(shard, split + "/" + key):
+				shutil.copy(images_dir + rel + f, voc + split + "/images/" +
+					fanout.subdir(layout, key))
 
 def make_voc_directories(voc):
 	"""
@@ -320,40 +377,84 @@ def make_voc_directories(voc):
 	os.makedirs(voc + "val/images")
 	os.makedirs(voc + "val/labels")
 
-def voc(kitti_dir, voc_dir, label=None):
+def voc(kitti_dir, voc_dir, label=None, label_map=None, shard=None,
+	layout=None):
 	print ("Convert kitti to voc")
 
-	# Make all directories for voc dataset
-	make_voc_directories(voc_dir)
-
-	# Iterate through kitti training data
-	for f in os.listdir(kitti_dir + "train/labels/"):
-		fname = (kitti_dir + "train/images/" + f).split(".txt")[0] + ".png"
-		if os.path.isfile(fname):
-			img = Image.open(fname)
-			w, h = img.size
-			img.close()
-			labels, coords = parse_labels_voc(os.path.join(kitti_dir +
-				"train/labels/" + f))
-			annotation = write_voc_file(fname, labels, coords, w, h)
-			et = etree.ElementTree(annotation)
-			et.write(voc_dir + "train/labels/" + f.split(".txt")[0] + ".xml", pretty_print=True)
-
-	# Iterate through kitti validation data
-	for f in os.listdir(kitti_dir + "val/labels/"):
-		fname = (kitti_dir + "val/images/" + f).split(".txt")[0] + ".png"
-		if os.path.isfile(fname):
-			img = Image.open(fname)
-			w, h = img.size
-			img.close()
-			labels, coords = parse_labels_voc(os.path.join(kitti_dir +
-				"val/labels/" + f))
-			annotation = write_voc_file(fname, labels, coords, w, h)
-			et = etree.ElementTree(annotation)
-			et.write(voc_dir + "val/labels/" + f.split(".txt")[0] + ".xml", pretty_print=True)
+	# Build optional class remapping (VOC is name based, no label file needed)
+	lmap = labelmap.load(None, label_map)
+
+	# Make all directories for voc dataset (a shard only adds to them)
+	if shard:
+		sharding.make_directories(voc_dir, shard)
+	else:
+		make_voc_directories(voc_dir)
+	meta_dir = sharding.shard_dir(voc_dir, shard)
+
+	# Iterate through kitti training and validation data, keeping the fields
+	# the target format cannot express in a sidecar next to the labels
+	samples = {}
+	for split in ["train", "val"]:
+		labels_dir = kitti_dir + split + "/labels/"
+		fanout.make_directories(voc_dir + split + "/", layout,
+			(key for key, rel, f in fanout.walk(labels_dir)
+				if sharding.owns(shard, split + "/" + key)))
+		sfile = open(meta_dir + split + "/" + annotations.SIDECAR, "w")
+		samples[split] = 0
+		for key, rel, f in fanout.walk(labels_dir):
+			if not sharding.owns(shard, split + "/" + key):
+				continue
+			fname = kitti_dir + split + "/images/" + rel + key + ".png"
+			if os.path.isfile(fname):
+				img = Image.open(fname)
+				w, h = img.size
+				img.close()
+				ann = parse_labels_voc(labels_dir + rel + f, lmap)
+				annotation = write_voc_file(fname, list(ann.names),
+					ann.boxes.astype(np.int64).tolist(), w, h, ann.fields)
+				et = etree.ElementTree(annotation)
+				et.write(voc_dir + split + "/labels/" + fanout.subdir(layout, key) + key + ".xml", pretty_print=True)
+				annotations.write_sidecar(sfile, key, ann)
+				samples[split] += 1
+		sfile.close()
+	lmap.report()
 
 	# Copy images from kitti to voc
-	copy_images_voc(kitti_dir, voc_dir)
+	copy_images_voc(kitti_dir, voc_dir, shard, layout)
+
+	if shard:
+		sharding.write_manifest(voc_dir, shard, samples)
+
+###########################################################
+##########        KITTI to COCO Conversion       ##########
+###########################################################
+def coco(kitti_dir, coco_dir, label=None, label_map=None):
+	print ("Converting kitti to coco")
+
+	# Build optional class list (category order) and remapping
+	lmap = labelmap.load(label, label_map)
+
+	# Make all directories for coco dataset
+	datasets_coco.make_directories(coco_dir, labels=False)
+
+	# Stream each split into its COCO file one image at a time
+	for split in ["train", "val"]:
+		writer = datasets_coco.CocoWriter(coco_dir + split + "/" +
+			datasets_coco.ANNOTATIONS, lmap.labels)
+		labels_dir = kitti_dir + split + "/labels/"
+		for key, rel, f in fanout.walk(labels_dir):
+			fname = kitti_dir + split + "/images/" + rel + key + ".png"
+			if os.path.isfile(fname):
+				img = Image.open(fname)
+				w, h = img.size
+				img.close()
+				ann = annotations.read_kitti(labels_dir + rel + f)
+				ann.names, keep = lmap.rename(ann.names)
+				image_id = writer.add_image(os.path.basename(fname), w, h)
+				writer.add_annotations(image_id, ann.select(keep))
+				shutil.copy(fname, coco_dir + split + "/images/")
+		writer.close()
+	lmap.report()
 
 ###########################################################
 ##########        KITTI to LISA Conversion        #########
@@ -0,0 +1,162 @@
+###############################################################################
+##########                        Label maps                         ##########
+"""
+A label file lists one class name per line; the line number (0-based) is the
+class index used by index based formats such as YOLO.
+
+A label map file renames, merges or drops classes while converting.  Each
+non-empty line holds a source class and the class it becomes:
+
+    Van             Car
+    Truck           Car
+    DontCare        -
+
+A target of '-' (or no target at all) drops every object of that class.
+Targets only need to be in the label file when the output format uses class
+indices (ex. YOLO); name based formats (KITTI, VOC, COCO) accept any name.
+Lines starting with '#' are comments.
+"""
+###############################################################################
+
+# Import necessary libraries
+import numpy as np
+
+def read_labels(label):
+	"""
+	Definition: Read a label file into a list of class names.  Blank lines
+		(including the trailing newline of the file) are ignored.
+
+	Parameters: label - path to label file
+	Returns: labels - list of class names in index order
+	"""
+	with open(label) as lfile:
+		return [line.strip() for line in lfile if line.strip()]
+
+def read_label_map(map_file):
+	"""
+	Definition: Read a label map file into a dictionary.
+
+	Parameters: map_file - path to label map file
+	Returns: mapping - dictionary of source class to target class, where a
+				target of None drops the class
+	"""
+	mapping = {}
+	with open(map_file) as mfile:
+		for line in mfile:
+			l = line.split()
+			if not l or l[0].startswith('#'):
+				continue
+			if len(l) > 1 and l[1] != '-':
+				mapping[l[0]] = l[1]
+			else:
+				mapping[l[0]] = None
+	return mapping
+
+class LabelMap(object):
+	"""
+	Definition: Bidirectional lookup between class names and class indices
+		with optional renaming/merging/dropping of classes.  All lookups
+		are done once per distinct class, so each file costs a single
+		vectorized pass over its class column.
+
+	Parameters: labels - list of class names (index order), or None when
+					the output format is name based and any class is valid
+				mapping - dictionary of source class to target class
+	"""
+	def __init__(self, labels=None, mapping=None):
+		self.labels = list(labels) if labels else []
+		self.index = dict((name, i) for i, name in enumerate(self.labels))
+		self.mapping = mapping or {}
+		self.unknown = set()
+
+	def map_name(self, name):
+		"""
+		Definition: Apply the label map to a single class name.
+
+		Parameters: name - class name from file
+		Returns: target class name, or None if the class is dropped
+		"""
+		return self.mapping.get(name, name)
+
+	def encode(self, names):
+		"""
+		Definition: Convert a column of class names to class indices.
+			Classes whose target is not in the label file are dropped.
+
+		Parameters: names - sequence of class names from file
+		Returns: indices - array of class indices (-1 where dropped)
+				 keep - boolean mask of objects that are kept
+		"""
+		uniq, inverse = np.unique(np.asarray(names, dtype=str),
+			return_inverse=True)
+		lookup = []
+		for n in uniq:
+			target = self.map_name(n)
+			if target is not None and target not in self.index:
+				self.unknown.add(n)
+			lookup.append(self.index.get(target, -1))
+		lookup = np.array(lookup, dtype=np.int64)
+		indices = lookup[inverse.reshape(-1)]
+		return indices, indices >= 0
+
+	def decode(self, indices):
+		"""
+		Definition: Convert a column of class indices to class names.  The
+			label map may rename classes to names outside the label file.
+
+		Parameters: indices - sequence of class indices from file
+		Returns: names - array of class names (None where dropped)
+				 keep - boolean mask of objects that are kept
+		"""
+		uniq, inverse = np.unique(np.asarray(indices, dtype=np.int64),
+			return_inverse=True)
+		lookup = []
+		for i in uniq:
+			if 0 <= i < len(self.labels):
+				lookup.append(self.map_name(self.labels[i]))
+			else:
+				self.unknown.add(str(i))
+				lookup.append(None)
+		return self._expand(lookup, inverse)
+
+	def rename(self, names):
+		"""
+		Definition: Apply the label map to a column of class names.
+
+		Parameters: names - sequence of class names from file
+		Returns: names - array of target class names (None where dropped)
+				 keep - boolean mask of objects that are kept
+		"""
+		uniq, inverse = np.unique(np.asarray(names, dtype=str),
+			return_inverse=True)
+		return self._expand([self.map_name(n) for n in uniq], inverse)
+
+	def _expand(self, lookup, inverse):
+		# Broadcast per-class results back onto the per-object column
+		inverse = inverse.reshape(-1)
+		names = np.array(lookup, dtype=object)[inverse]
+		keep = np.array([n is not None for n in lookup], dtype=bool)[inverse]
+		return names, keep
+
+	def report(self):
+		"""
+		Definition: Print the classes that were skipped because they are
+			not part of the label file.
+
+		Parameters: None
+		Returns: None
+		"""
+		if self.unknown:
+			print ("Skipped unknown classes: " + ", ".join(sorted(self.unknown)))
+
+def load(label=None, map_file=None):
+	"""
+	Definition: Build a label map from a label file and a label map file.
+
+	Parameters: label - path to label file (or None)
+				map_file - path to label map file (or None)
+	Returns: LabelMap instance
+	"""
+	labels = read_labels(label) if label else None
+	mapping = read_label_map(map_file) if map_file else None
+	return LabelMap(labels, mapping)
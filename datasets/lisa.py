@@ -46,8 +46,8 @@ def create_labels_kitti(fp_train, fp_val, out_train, out_val):
 
 	csvf_train = csv.reader(f_train, delimiter=';')
 	csvf_val = csv.reader(f_val, delimiter=';')
-	header_train = csvf_train.next()
-	header_val = csvf_val.next()
+	header_train = next(csvf_train)
+	header_val = next(csvf_val)
 
 	fnameIdx_train = header_train.index("Filename")
 	fnameIdx_val = header_val.index("Filename")
@@ -0,0 +1,169 @@
+###############################################################################
+##########                   On-the-fly conversion                   ##########
+"""
+Converts samples lazily for a data loader instead of writing a converted
+copy of the dataset.  Each sample is the source image (path, or raw bytes)
+plus its boxes in the target format:
+
+    yolo     class indices and normalized (x, y, width, height) boxes
+    kitti    class names and pixel (x1, y1, x2, y2) boxes
+
+Labels are parsed with the same parse_labels_* functions as the converters
+and the converted annotations are kept in a size-bounded LRU cache, so
+later epochs do not parse the label files again.  Cached arrays are
+read-only; copy them before augmenting boxes in place.
+
+    loader = Loader('kitti/', 'kitti', 'yolo', 'train', label='labels.txt')
+    for image, classes, boxes in loader:
+        ...
+"""
+###############################################################################
+
+# Import necessary libraries
+import collections
+from PIL import Image
+
+from . import annotations, fanout, kitti, labelmap, yolo
+
+CONVERSIONS = [('kitti', 'yolo'), ('yolo', 'kitti')]
+
+class LRUCache(object):
+	"""
+	Definition: Least recently used cache bounded by the total size of the
+		cached values.
+
+	Parameters: max_bytes - maximum total size of cached values
+	"""
+	def __init__(self, max_bytes):
+		self.max_bytes = max_bytes
+		self.items = collections.OrderedDict()
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key):
+		"""
+		Definition: Look up a value and mark it as most recently used.
+
+		Parameters: key - cache key
+		Returns: cached value, or None if not cached
+		"""
+		if key not in self.items:
+			self.misses += 1
+			return None
+		value, nbytes = self.items.pop(key)
+		self.items[key] = (value, nbytes)
+		self.hits += 1
+		return value
+
+	def put(self, key, value, nbytes):
+		"""
+		Definition: Add a value, evicting least recently used values until
+			the cache fits in its size bound.
+
+		Parameters: key - cache key
+					value - value to be cached
+					nbytes - size of value in bytes
+		Returns: None
+		"""
+		if key in self.items:
+			self.size -= self.items.pop(key)[1]
+		if nbytes > self.max_bytes:
+			return
+		self.items[key] = (value, nbytes)
+		self.size += nbytes
+		while self.size > self.max_bytes:
+			self.size -= self.items.popitem(last=False)[1][1]
+
+	def __len__(self):
+		return len(self.items)
+
+class Loader(object):
+	"""
+	Definition: Sequence of converted samples of one split of a dataset.
+		Nothing is written to disk.
+
+	Parameters: src_dir - path to dataset (contains 'train' and 'val')
+				fmt - format of the dataset ('kitti' or 'yolo')
+				to - format of the boxes to return ('yolo' or 'kitti')
+				split - split to load ('train' or 'val')
+				label - path to label file
+				label_map - path to label map file (or None)
+				cache_bytes - size bound of the annotation cache
+				read_images - return image bytes instead of image paths
+	"""
+	def __init__(self, src_dir, fmt, to, split="train", label=None,
+		label_map=None, cache_bytes=64 << 20, read_images=False):
+		if (fmt, to) not in CONVERSIONS:
+			raise ValueError("Unsupported conversion: %s to %s" % (fmt, to))
+		if not label:
+			raise ValueError("A label file is necessary for %s to %s "
+				"conversion" % (fmt, to))
+		self.fmt = fmt
+		self.read_images = read_images
+		self.lmap = labelmap.load(label, label_map)
+		self.cache = LRUCache(cache_bytes)
+
+		# Samples are the images that have a label file
+		images = fanout.index_dir(src_dir + split + "/images/")
+		labels = fanout.index_dir(src_dir + split + "/labels/")
+		self.samples = [(src_dir + split + "/images/" + images[key],
+			src_dir + split + "/labels/" + labels[key])
+			for key in sorted(images) if key in labels]
+
+	def __len__(self):
+		return len(self.samples)
+
+	def annotations(self, index):
+		"""
+		Definition: Converted annotations of one sample (from the cache
+			when possible).
+
+		Parameters: index - index of sample
+		Returns: labels - class indices (yolo) or class names (kitti)
+				 boxes - (N, 4) read-only array of boxes in the target format
+		"""
+		cached = self.cache.get(index)
+		if cached is not None:
+			return cached
+		image_file, label_file = self.samples[index]
+		img = Image.open(image_file)
+		w, h = img.size
+		img.close()
+		if self.fmt == 'kitti':
+			ann = kitti.parse_labels_yolo(label_file, self.lmap)
+			labels = ann.classes
+			boxes = annotations.to_yolo(ann.boxes, w, h)
+			nbytes = labels.nbytes + boxes.nbytes
+		else:
+			ann = yolo.parse_labels_kitti(label_file, self.lmap, w, h)
+			labels = ann.names
+			boxes = ann.boxes
+			nbytes = boxes.nbytes + sum(64 + len(n) for n in labels)
+		# The cached arrays are shared by every later lookup of the sample
+		labels.setflags(write=False)
+		boxes.setflags(write=False)
+		self.cache.put(index, (labels, boxes), nbytes)
+		return labels, boxes
+
+	def __getitem__(self, index):
+		"""
+		Definition: One converted sample.
+
+		Parameters: index - index of sample
+		Returns: image - path to image (or its bytes with read_images)
+				 labels - class indices (yolo) or class names (kitti)
+				 boxes - (N, 4) array of boxes in the target format
+		"""
+		if index < 0:
+			index += len(self)
+		labels, boxes = self.annotations(index)
+		image = self.samples[index][0]
+		if self.read_images:
+			with open(image, "rb") as f:
+				image = f.read()
+		return image, labels, boxes
+
+	def __iter__(self):
+		for index in range(len(self)):
+			yield self[index]
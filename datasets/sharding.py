@@ -0,0 +1,159 @@
+###############################################################################
+##########                  Sharded conversion                       ##########
+"""
+A conversion can be split across independent nodes (or local processes) by
+giving each one a shard (index, number of shards).  Samples are assigned to
+shards by a hash of their relative path ('<split>/<name>'), so every shard
+converts a disjoint slice into the same output tree without coordination.
+
+Files that would be shared between shards (train.txt, val.txt, sidecars)
+are written per shard under 'shards/<index>-of-<count>/' along with a
+manifest.  Once every shard is done, finalize() merges them into the
+output tree and removes the per-shard directories.
+"""
+###############################################################################
+
+# Import necessary libraries
+import os, re, shutil, json, zlib
+
+SHARDS = "shards/"
+MANIFEST = "manifest.json"
+
+# Name of a shard directory ('00003-of-00008')
+SHARD_NAME = re.compile(r'^(\d+)-of-(\d+)$')
+
+def shard_of(relpath, num_shards):
+	"""
+	Definition: Deterministically assign a sample to a shard.
+
+	Parameters: relpath - path of sample relative to dataset ('train/000042')
+				num_shards - total number of shards
+	Returns: index of shard the sample belongs to
+	"""
+	return (zlib.crc32(relpath.encode('utf-8')) & 0xffffffff) % num_shards
+
+def owns(shard, relpath):
+	"""
+	Definition: Check if a sample belongs to the given shard.
+
+	Parameters: shard - (index, num_shards) tuple, or None (no sharding)
+				relpath - path of sample relative to dataset ('train/000042')
+	Returns: True if the sample should be converted by this shard
+	"""
+	return shard is None or shard_of(relpath, shard[1]) == shard[0]
+
+def shard_dir(out_dir, shard):
+	"""
+	Definition: Directory for the files of a shard that are merged later.
+
+	Parameters: out_dir - path to output dataset
+				shard - (index, num_shards) tuple, or None (no sharding)
+	Returns: path to directory (out_dir itself without sharding)
+	"""
+	if shard is None:
+		return out_dir
+	return out_dir + SHARDS + "%05d-of-%05d/" % (shard[0], shard[1])
+
+def make_directories(out_dir, shard):
+	"""
+	Definition: Make the output directories for one shard.  Unlike the
+		make_*_directories functions nothing is removed, since other
+		shards may be writing into the same tree.
+
+	Parameters: out_dir - path to output dataset
+				shard - (index, num_shards) tuple
+	Returns: None
+	"""
+	for d in [out_dir + "train/images", out_dir + "train/labels",
+		out_dir + "val/images", out_dir + "val/labels",
+		shard_dir(out_dir, shard) + "train", shard_dir(out_dir, shard) + "val"]:
+		try:
+			os.makedirs(d)
+		except OSError:
+			if not os.path.isdir(d):
+				raise
+
+def write_manifest(out_dir, shard, samples):
+	"""
+	Definition: Mark a shard as complete.
+
+	Parameters: out_dir - path to output dataset
+				shard - (index, num_shards) tuple
+				samples - dictionary of split to number of samples converted
+	Returns: None
+	"""
+	manifest = {"shard": shard[0], "num_shards": shard[1], "samples": samples}
+	with open(shard_dir(out_dir, shard) + MANIFEST, "w") as mfile:
+		json.dump(manifest, mfile)
+
+def finalize(out_dir):
+	"""
+	Definition: Merge the per-shard files (train.txt, val.txt, sidecars)
+		and manifests of a sharded conversion into the output tree.  Every
+		shard must have completed.
+
+	Parameters: out_dir - path to output dataset
+	Returns: dictionary of split to number of samples converted, or None
+		if shards are missing or do not belong to the same conversion
+	"""
+	if not os.path.isdir(out_dir + SHARDS):
+		print ("Error: No shards found in " + out_dir)
+		return None
+	shards = sorted(os.listdir(out_dir + SHARDS))
+	if not shards:
+		print ("Error: No shards found in " + out_dir)
+		return None
+
+	# Every shard directory must come from the same number of shards
+	parsed = [SHARD_NAME.match(s) for s in shards]
+	unknown = [s for s, m in zip(shards, parsed) if m is None]
+	if unknown:
+		print ("Error: Unexpected entries in " + out_dir + SHARDS + ": " +
+			", ".join(unknown))
+		return None
+	counts = sorted(set(int(m.group(2)) for m in parsed))
+	if len(counts) > 1:
+		print ("Error: Shards of conversions with different numbers of "
+			"shards (%s) in %s" % (", ".join(str(c) for c in counts),
+			out_dir + SHARDS))
+		return None
+	num_shards = counts[0]
+	bad = [s for s, m in zip(shards, parsed) if int(m.group(1)) >= num_shards]
+	if bad:
+		print ("Error: Shard index out of range: " + ", ".join(bad))
+		return None
+	done = [s for s in shards
+		if os.path.isfile(out_dir + SHARDS + s + "/" + MANIFEST)]
+	if len(done) != num_shards:
+		print ("Error: %d of %d shards completed." % (len(done), num_shards))
+		return None
+
+	# Collect every file written by the shards (relative to the shard dir)
+	files = set()
+	for s in shards:
+		root = out_dir + SHARDS + s + "/"
+		for dirpath, dirnames, filenames in os.walk(root):
+			for f in filenames:
+				files.add(os.path.relpath(os.path.join(dirpath, f), root))
+	files.discard(MANIFEST)
+
+	# Concatenate them in shard order
+	for relpath in sorted(files):
+		with open(out_dir + relpath, "wb") as out:
+			for s in shards:
+				path = out_dir + SHARDS + s + "/" + relpath
+				if os.path.isfile(path):
+					with open(path, "rb") as part:
+						shutil.copyfileobj(part, out)
+
+	# Merge manifests
+	samples = {}
+	for s in shards:
+		with open(out_dir + SHARDS + s + "/" + MANIFEST) as mfile:
+			for split, count in json.load(mfile)["samples"].items():
+				samples[split] = samples.get(split, 0) + count
+	with open(out_dir + MANIFEST, "w") as mfile:
+		json.dump({"num_shards": num_shards, "samples": samples}, mfile)
+
+	shutil.rmtree(out_dir + SHARDS)
+	return samples
@@ -0,0 +1,151 @@
+###############################################################################
+##########                    Image transforms                       ##########
+"""
+Geometric transforms applied while an image is being transcoded, so each
+image is decoded and encoded exactly once per conversion.  Box coordinates
+(pixel x1, y1, x2, y2) are adjusted with the same parameters in a single
+vectorized pass.
+"""
+###############################################################################
+
+# Import necessary libraries
+import numpy as np
+from PIL import Image
+
+def resize_params(img_width, img_height, size, keep_aspect=False):
+	"""
+	Definition: Compute the scale and padding that map an image onto the
+		target size.  With keep_aspect the image is scaled to fit and
+		centered (letterbox), otherwise it is stretched.
+
+	Parameters: img_width - width of input image
+				img_height - height of input image
+				size - (width, height) of output image
+				keep_aspect - keep aspect ratio and pad the borders
+	Returns: scale_x, scale_y - scale factors applied to the image
+			 pad_x, pad_y - offset of the scaled image in the output
+			 new_width, new_height - size of the scaled image
+	"""
+	scale_x = float(size[0]) / float(img_width)
+	scale_y = float(size[1]) / float(img_height)
+	if not keep_aspect:
+		return scale_x, scale_y, 0, 0, int(size[0]), int(size[1])
+	scale = min(scale_x, scale_y)
+	new_width = max(1, int(round(img_width * scale)))
+	new_height = max(1, int(round(img_height * scale)))
+	pad_x = (int(size[0]) - new_width) // 2
+	pad_y = (int(size[1]) - new_height) // 2
+	return scale, scale, pad_x, pad_y, new_width, new_height
+
+def transform_boxes(boxes, scale_x, scale_y, pad_x=0, pad_y=0):
+	"""
+	Definition: Scale and shift pixel boxes (x1, y1, x2, y2).
+
+	Parameters: boxes - (N, 4) array of pixel coordinates
+				scale_x, scale_y - scale factors
+				pad_x, pad_y - offset added after scaling
+	Returns: (N, 4) array of transformed pixel coordinates
+	"""
+	scale = np.array([scale_x, scale_y, scale_x, scale_y], dtype=np.float64)
+	offset = np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float64)
+	return np.asarray(boxes, dtype=np.float64).reshape(-1, 4) * scale + offset
+
+def open_image(image_file, size=None, keep_aspect=False):
+	"""
+	Definition: Open an image for transcoding.  When the image will be
+		downscaled and is a JPEG, the decoder is asked (PIL draft mode) to
+		decode at a reduced scale that is still at least the output size.
+
+	Parameters: image_file - path to input image
+				size - (width, height) of output image, or None
+				keep_aspect - keep aspect ratio and pad the borders
+	Returns: img - opened PIL image
+			 img_width, img_height - size of the image on disk
+	"""
+	img = Image.open(image_file)
+	img_width, img_height = img.size
+	if size and img.format == 'JPEG':
+		params = resize_params(img_width, img_height, size, keep_aspect)
+		img.draft('RGB', (params[4], params[5]))
+	return img, img_width, img_height
+
+def resize_image(img, img_width, img_height, size, keep_aspect=False,
+	pad_value=0):
+	"""
+	Definition: Resize (or letterbox) an opened image to the output size.
+
+	Parameters: img - opened PIL image
+				img_width, img_height - size of the image on disk
+				size - (width, height) of output image
+				keep_aspect - keep aspect ratio and pad the borders
+				pad_value - gray level used for the padding
+	Returns: img - resized PIL image
+			 params - (scale_x, scale_y, pad_x, pad_y) to apply to boxes
+	"""
+	scale_x, scale_y, pad_x, pad_y, new_width, new_height = resize_params(
+		img_width, img_height, size, keep_aspect)
+	if img.mode not in ('RGB', 'L'):
+		img = img.convert('RGB')
+	img = img.resize((new_width, new_height), Image.BILINEAR)
+	if keep_aspect:
+		canvas = Image.new(img.mode, (int(size[0]), int(size[1])),
+			pad_value if img.mode == 'L' else (pad_value,) * 3)
+		canvas.paste(img, (pad_x, pad_y))
+		img = canvas
+	return img, (scale_x, scale_y, pad_x, pad_y)
+
+def tile_grid(img_width, img_height, size, overlap=0):
+	"""
+	Definition: Lay out overlapping fixed-size tiles covering an image.  The
+		last row/column of tiles is aligned with the image border, and tiles
+		never exceed the image.
+
+	Parameters: img_width - width of image
+				img_height - height of image
+				size - (width, height) of tiles
+				overlap - overlap between neighbouring tiles (in pixels)
+	Returns: (T, 4) array of tile pixel coordinates (x1, y1, x2, y2)
+	"""
+	if not 0 <= overlap < min(size):
+		raise ValueError("Tile overlap must be between 0 and the tile size "
+			"minus one, got %d for %dx%d tiles" % (overlap, size[0], size[1]))
+
+	def starts(length, tile):
+		# An image smaller than the tile gets a single tile covering it
+		tile = min(tile, length)
+		stride = tile - overlap if overlap < tile else tile
+		s = list(range(0, length - tile + 1, stride))
+		if s[-1] + tile < length:
+			s.append(length - tile)
+		return s, tile
+
+	xs, tile_w = starts(int(img_width), int(size[0]))
+	ys, tile_h = starts(int(img_height), int(size[1]))
+	grid = np.array([(x, y, x + tile_w, y + tile_h) for y in ys for x in xs],
+		dtype=np.float64)
+	return grid
+
+def tile_boxes(boxes, tiles, min_visibility=0.25):
+	"""
+	Definition: Clip every box to every tile in one vectorized pass.  A box
+		is assigned to a tile when the visible part of it is at least
+		min_visibility of its area.
+
+	Parameters: boxes - (N, 4) array of pixel coordinates
+				tiles - (T, 4) array of tile pixel coordinates
+				min_visibility - fraction of a box that must be in a tile
+	Returns: keep - (T, N) boolean mask of boxes assigned to each tile
+			 local - (T, N, 4) clipped boxes relative to each tile
+			 visibility - (T, N) visible fraction of each box in each tile
+	"""
+	b = np.asarray(boxes, dtype=np.float64).reshape(1, -1, 4)
+	t = np.asarray(tiles, dtype=np.float64).reshape(-1, 1, 4)
+	clipped = np.concatenate([np.maximum(b[..., :2], t[..., :2]),
+		np.minimum(b[..., 2:], t[..., 2:])], axis=2)
+	inter = (np.clip(clipped[..., 2] - clipped[..., 0], 0, None) *
+		np.clip(clipped[..., 3] - clipped[..., 1], 0, None))
+	area = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+	visibility = inter / np.maximum(area, 1e-9)
+	keep = (inter > 0) & (visibility >= min_visibility)
+	local = clipped - np.concatenate([t[..., :2], t[..., :2]], axis=2)
+	return keep, local, visibility
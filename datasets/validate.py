@@ -0,0 +1,190 @@
+###############################################################################
+##########                  Dataset validation                       ##########
+"""
+Checks a source dataset without writing anything.  The directory tree is
+indexed with a single listing per directory, images are probed for their
+size from the header only (no pixel decode) and the boxes of each label
+file are checked in one vectorized pass:
+
+    orphan image        image without a label file
+    orphan label        label file without an image
+    unreadable image    image header cannot be read
+    malformed label     label file cannot be parsed
+    unknown class       class not in the label file (or bad class index)
+    out of bounds       box extends past the image borders
+    degenerate box      box with zero or negative width/height
+
+Classes the label map drops ('DontCare -') are not unknown.  KITTI's
+DontCare regions mark unlabeled areas rather than objects, so they are
+never reported as an unknown class either.  The boxes of every other
+object, including those of unknown classes, are checked.
+"""
+###############################################################################
+
+# Import necessary libraries
+import numpy as np
+from PIL import Image
+
+from . import annotations, fanout, labelmap, workers
+
+FORMATS = ['kitti', 'yolo']
+
+# Classes that mark ignored regions rather than objects, by format
+IGNORED = {'kitti': set(['DontCare'])}
+
+ISSUES = ['orphan image', 'orphan label', 'unreadable image',
+	'malformed label', 'unknown class', 'out of bounds', 'degenerate box']
+
+# Label map of the current worker process (set by _init_worker)
+_label_map = None
+
+def _init_worker(label_map):
+	global _label_map
+	_label_map = label_map
+
+def check_boxes(boxes, img_width, img_height):
+	"""
+	Definition: Check pixel boxes (x1, y1, x2, y2) against the image size.
+
+	Parameters: boxes - (N, 4) array of pixel coordinates
+				img_width - width of image
+				img_height - height of image
+	Returns: out_of_bounds - boolean mask of boxes past the image borders
+			 degenerate - boolean mask of boxes with no area
+	"""
+	b = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+	out_of_bounds = ((b[:, 0] < 0) | (b[:, 1] < 0) |
+		(b[:, 2] > img_width) | (b[:, 3] > img_height))
+	degenerate = (b[:, 2] <= b[:, 0]) | (b[:, 3] <= b[:, 1])
+	return out_of_bounds, degenerate
+
+def dropped(fmt, ann):
+	"""
+	Definition: Find the objects that are left out on purpose, either
+		dropped by the label map or of an ignored class (ex. DontCare).
+		Objects of unknown classes are not left out, so their boxes are
+		still checked.
+
+	Parameters: fmt - format of the dataset ('kitti' or 'yolo')
+				ann - Annotations of one label file
+	Returns: boolean mask of objects left out of the box checks
+	"""
+	ignored = IGNORED.get(fmt, set())
+	if fmt == 'kitti':
+		uniq, inverse = np.unique(np.asarray(ann.names, dtype=str),
+			return_inverse=True)
+		lookup = [n in ignored or _label_map.map_name(n) is None for n in uniq]
+	else:
+		uniq, inverse = np.unique(np.asarray(ann.classes, dtype=np.int64),
+			return_inverse=True)
+		labels = _label_map.labels or []
+		lookup = [0 <= i < len(labels) and
+			_label_map.map_name(labels[i]) is None for i in uniq]
+	return np.array(lookup, dtype=bool)[inverse.reshape(-1)]
+
+def check_sample(task):
+	"""
+	Definition: Check one image/label pair.
+
+	Parameters: task - (fmt, key, image_file, label_file) where fmt is
+				the dataset format and either file may be None
+	Returns: key - sample name
+			 objects - number of objects in the label file
+			 issues - list of (issue, detail) tuples
+	"""
+	fmt, key, image_file, label_file = task
+	if image_file is None:
+		return key, 0, [('orphan label', label_file)]
+	try:
+		img = Image.open(image_file)
+		w, h = img.size
+		img.close()
+	except (IOError, OSError, SyntaxError) as e:
+		return key, 0, [('unreadable image', '%s (%s)' % (image_file, e))]
+	if label_file is None:
+		return key, 0, [('orphan image', image_file)]
+
+	try:
+		if fmt == 'kitti':
+			ann = annotations.read_kitti(label_file)
+			_label_map.unknown = set()
+			if _label_map.labels:
+				_label_map.encode(ann.names)
+			else:
+				_label_map.rename(ann.names)
+		else:
+			ann = annotations.read_yolo(label_file, w, h)
+			_label_map.unknown = set()
+			_label_map.decode(ann.classes)
+	except (ValueError, IndexError) as e:
+		return key, 0, [('malformed label', '%s (%s)' % (label_file, e))]
+	if np.isnan(ann.boxes).any():
+		return key, 0, [('malformed label', '%s (missing box)' % label_file)]
+
+	issues = []
+	for name in sorted(_label_map.unknown - IGNORED.get(fmt, set())):
+		issues.append(('unknown class', '%s: %s' % (label_file, name)))
+	boxes = ann.boxes[~dropped(fmt, ann)]
+	out_of_bounds, degenerate = check_boxes(boxes, w, h)
+	for i in np.flatnonzero(out_of_bounds):
+		issues.append(('out of bounds', '%s: %s in %dx%d' % (label_file,
+			boxes[i].tolist(), w, h)))
+	for i in np.flatnonzero(degenerate):
+		issues.append(('degenerate box', '%s: %s' % (label_file,
+			boxes[i].tolist())))
+	return key, len(ann), issues
+
+def validate(fmt, src_dir, label=None, label_map=None, jobs=1, examples=10):
+	"""
+	Definition: Check every sample of a dataset and print a report.
+		Nothing is written.
+
+	Parameters: fmt - format of the dataset ('kitti' or 'yolo')
+				src_dir - path to dataset (contains 'train' and 'val')
+				label - path to label file (needed for yolo, optional for
+					kitti where it enables the unknown class check)
+				label_map - path to label map file (or None)
+				jobs - number of worker processes
+				examples - number of examples printed per issue type
+	Returns: total number of issues found
+	"""
+	if fmt not in FORMATS:
+		print ("Error: Validation is not supported for " + fmt + " datasets.")
+		return 1
+	print ("Validating " + fmt + " dataset")
+	lmap = labelmap.load(label, label_map)
+
+	total = 0
+	for split in ["train", "val"]:
+		images = fanout.index_dir(src_dir + split + "/images/")
+		labels = fanout.index_dir(src_dir + split + "/labels/")
+		tasks = []
+		for key in sorted(set(images) | set(labels)):
+			image_file = src_dir + split + "/images/" + images[key] \
+				if key in images else None
+			label_file = src_dir + split + "/labels/" + labels[key] \
+				if key in labels else None
+			tasks.append((fmt, key, image_file, label_file))
+
+		objects = 0
+		found = dict((issue, []) for issue in ISSUES)
+		for key, count, issues in workers.imap(check_sample, tasks, jobs,
+			_init_worker, (lmap,)):
+			objects += count
+			for issue, detail in issues:
+				found[issue].append(detail)
+
+		print ("%s: %d images, %d labels, %d objects" % (split, len(images),
+			len(labels), objects))
+		for issue in ISSUES:
+			if found[issue]:
+				print ("  %s: %d" % (issue, len(found[issue])))
+				for detail in sorted(found[issue])[:examples]:
+					print ("    " + detail)
+			total += len(found[issue])
+
+	if total:
+		print ("Found %d issues." % total)
+	else:
+		print ("No issues found.")
+	return total
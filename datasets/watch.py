@@ -0,0 +1,251 @@
+###############################################################################
+##########                       Watch mode                          ##########
+"""
+Converts a kitti dataset to yolo continuously while new samples land in
+'<split>/images' and '<split>/labels'.  The output tree is never wiped:
+samples that have no yolo image yet are converted on start up, then new
+files are picked up as they are written.
+
+Changes are detected with inotify (Linux) and fall back to polling the
+directories when inotify is not available.  A sample is converted once
+both its image and its label file exist and neither has changed for the
+debounce interval, so half-written files are never read.  Converted
+samples are appended to train.txt/val.txt and the sidecar.
+"""
+###############################################################################
+
+# Import necessary libraries
+import os, sys, time, errno, select, struct, ctypes, ctypes.util
+
+from . import annotations, fanout, kitti, labelmap, sharding, workers
+
+SPLITS = ["train", "val"]
+
+# inotify events for files that are complete (written and closed, or moved
+# into the directory)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+# Conversion settings of the current worker process (set by _init_worker)
+_settings = None
+
+def _init_worker(settings):
+	global _settings
+	_settings = settings
+
+def _convert(task):
+	# Convert one sample in a worker; returns what the main process appends
+	split, key, image_file, label_file, yolo_image, yolo_label = task
+	lmap, resize, keep_aspect, pad_value = _settings
+	try:
+		ann = kitti.convert_sample_yolo(image_file, label_file, yolo_image,
+			yolo_label, lmap, resize, keep_aspect, pad_value)
+	except (IOError, OSError, ValueError) as e:
+		return split, key, yolo_image, None, str(e)
+	return split, key, yolo_image, ann, None
+
+class _Inotify(object):
+	"""
+	Definition: Minimal inotify binding (ctypes) reporting files that were
+		closed after writing or moved into the watched directories.
+
+	Parameters: paths - list of directories to watch
+	"""
+	def __init__(self, paths):
+		libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+		self.fd = libc.inotify_init()
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), "inotify_init failed")
+		self.paths = {}
+		for path in paths:
+			wd = libc.inotify_add_watch(self.fd, path.encode('utf-8'),
+				IN_CLOSE_WRITE | IN_MOVED_TO)
+			if wd < 0:
+				os.close(self.fd)
+				raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+			self.paths[wd] = path
+
+	def events(self, timeout):
+		"""
+		Definition: Wait for events.
+
+		Parameters: timeout - seconds to wait at most
+		Returns: list of (directory, file name) tuples
+		"""
+		try:
+			ready = select.select([self.fd], [], [], timeout)[0]
+		except (OSError, select.error) as e:
+			if e.args[0] == errno.EINTR:
+				return []
+			raise
+		if not ready:
+			return []
+		data = os.read(self.fd, 1 << 16)
+		found = []
+		offset = 0
+		while offset < len(data):
+			wd, mask, cookie, length = struct.unpack_from('iIII', data, offset)
+			name = data[offset + 16:offset + 16 + length].rstrip(b'\0')
+			if wd in self.paths and name:
+				found.append((self.paths[wd], name.decode('utf-8')))
+			offset += 16 + length
+		return found
+
+	def close(self):
+		os.close(self.fd)
+
+class _Poller(object):
+	"""
+	Definition: Polling replacement for _Inotify, reporting files that
+		showed up in the watched directories since the last call.
+
+	Parameters: paths - list of directories to watch
+	"""
+	def __init__(self, paths):
+		self.known = dict((path, set(os.listdir(path))) for path in paths)
+
+	def events(self, timeout):
+		time.sleep(timeout)
+		found = []
+		for path, known in self.known.items():
+			current = set(os.listdir(path))
+			found.extend((path, name) for name in current - known)
+			self.known[path] = current
+		return found
+
+	def close(self):
+		pass
+
+def _signature(paths):
+	# Size and modification time of both files (None while missing)
+	sig = []
+	for path in paths:
+		try:
+			st = os.stat(path)
+			sig.append((st.st_size, st.st_mtime))
+		except OSError:
+			sig.append(None)
+	return tuple(sig)
+
+def watch(kitti_dir, yolo_dir, label=None, label_map=None, resize=None,
+	keep_aspect=False, pad_value=0, jobs=1, debounce=1.0, interval=0.5,
+	polling=False, duration=None, layout=None):
+	"""
+	Definition: Convert kitti samples to yolo as they land, until
+		interrupted (Ctrl-C) or for a given duration.
+
+	Parameters: kitti_dir - path to kitti directory (contains 'train' and 'val')
+				yolo_dir - path to yolo output directory (kept if it exists)
+				label - path to label file
+				label_map - path to label map file (or None)
+				resize, keep_aspect, pad_value - see kitti.convert_sample_yolo
+				jobs - number of worker processes
+				debounce - seconds a sample must stay unchanged before it
+					is converted
+				interval - seconds between checks of pending samples
+				polling - poll the directories instead of using inotify
+				duration - stop after this many seconds (None runs forever)
+				layout - (mode, levels) fan-out of the output, or None
+	Returns: number of samples converted
+	"""
+	print ("Watching " + kitti_dir + " (kitti to yolo)")
+	lmap = labelmap.load(label, label_map)
+	sharding.make_directories(yolo_dir, None)
+
+	dirs = {}
+	for split in SPLITS:
+		for kind in ["images", "labels"]:
+			dirs[kitti_dir + split + "/" + kind] = (split, kind)
+	if not polling:
+		try:
+			watcher = _Inotify(list(dirs))
+		except (OSError, AttributeError):
+			print ("inotify not available, polling for changes")
+			polling = True
+	if polling:
+		watcher = _Poller(list(dirs))
+
+	# Samples waiting to be converted: (split, key) -> [signature, changed]
+	pending = {}
+	images = {}
+	done = set()
+
+	def add(split, kind, name, changed):
+		# Any change (re)starts the debounce interval of the sample
+		if name.startswith('.'):
+			return
+		key = os.path.splitext(name)[0]
+		if kind == "images":
+			images[(split, key)] = name
+		pending[(split, key)] = [None, changed]
+
+	# Catch up with samples that landed while nothing was watching
+	for split in SPLITS:
+		for name in os.listdir(kitti_dir + split + "/images/"):
+			key = os.path.splitext(name)[0]
+			if os.path.isfile(yolo_dir + split + "/images/" +
+				fanout.subdir(layout, key) + key + ".jpg"):
+				images[(split, key)] = name
+				done.add((split, key))
+			else:
+				add(split, "images", name, float('-inf'))
+
+	pool = workers.start(jobs, _init_worker,
+		((lmap, resize, keep_aspect, pad_value),))
+	converted = 0
+	start = time.time()
+	try:
+		while duration is None or time.time() - start < duration:
+			for path, name in watcher.events(interval):
+				add(dirs[path][0], dirs[path][1], name, time.time())
+
+			# Pick the samples whose files are complete and settled
+			now = time.time()
+			tasks = []
+			for (split, key), state in list(pending.items()):
+				if (split, key) not in images:
+					continue
+				image_file = kitti_dir + split + "/images/" + images[(split, key)]
+				label_file = kitti_dir + split + "/labels/" + key + ".txt"
+				sig = _signature([image_file, label_file])
+				if sig != state[0] and state[1] != float('-inf'):
+					state[0], state[1] = sig, now
+				elif None not in sig and now - state[1] >= debounce:
+					del pending[(split, key)]
+					sub = fanout.subdir(layout, key)
+					tasks.append((split, key, image_file, label_file,
+						yolo_dir + split + "/images/" + sub + key + ".jpg",
+						yolo_dir + split + "/labels/" + sub + key + ".txt"))
+			if not tasks:
+				continue
+			for split in SPLITS:
+				fanout.make_directories(yolo_dir + split + "/", layout,
+					[t[1] for t in tasks if t[0] == split])
+
+			# Convert them in the pool and append to the lists and sidecars
+			lists = dict((s, open(yolo_dir + s + ".txt", "a")) for s in SPLITS)
+			sidecars = dict((s, open(yolo_dir + s + "/" + annotations.SIDECAR,
+				"a")) for s in SPLITS)
+			for split, key, yolo_image, ann, error in workers.imap(_convert,
+				tasks, pool=pool):
+				if error:
+					print ("Error: " + split + "/" + key + ": " + error)
+					continue
+				annotations.write_sidecar(sidecars[split], key, ann)
+				if (split, key) not in done:
+					lists[split].write('%s\n' % (yolo_image))
+					done.add((split, key))
+				converted += 1
+			for f in list(lists.values()) + list(sidecars.values()):
+				f.close()
+			print ("Converted %d samples (%d total)" % (len(tasks), converted))
+			sys.stdout.flush()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		watcher.close()
+		if pool is not None:
+			pool.close()
+			pool.join()
+	lmap.report()
+	return converted
@@ -0,0 +1,66 @@
+###############################################################################
+##########                      Worker pool                          ##########
+"""
+Runs per-sample work (validation, conversion) across a pool of processes.
+With a single job everything runs in the calling process, which keeps
+tracebacks readable and avoids the pool start-up cost on small datasets.
+"""
+###############################################################################
+
+# Import necessary libraries
+import signal, multiprocessing
+
+def _init(initializer, initargs):
+	# Ctrl-C is handled by the parent process, which shuts the pool down
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	if initializer:
+		initializer(*initargs)
+
+def start(jobs=1, initializer=None, initargs=()):
+	"""
+	Definition: Start a pool that can be reused across several imap calls
+		(ex. by a long running watcher).
+
+	Parameters: jobs - number of worker processes
+				initializer - optional function run once in each worker
+				initargs - arguments for initializer
+	Returns: multiprocessing pool, or None for a single job (in which case
+		the initializer is run in the calling process)
+	"""
+	if not jobs or jobs <= 1:
+		if initializer:
+			initializer(*initargs)
+		return None
+	return multiprocessing.Pool(jobs, _init, (initializer, initargs))
+
+def imap(func, tasks, jobs=1, initializer=None, initargs=(), pool=None):
+	"""
+	Definition: Apply a function to every task, yielding results as they
+		complete (in any order when more than one job is used).
+
+	Parameters: func - picklable function taking a single task
+				tasks - iterable of tasks
+				jobs - number of worker processes
+				initializer - optional function run once in each worker
+				initargs - arguments for initializer
+				pool - pool returned by start() to reuse (its workers are
+					already initialized, jobs and initializer are ignored)
+	Returns: generator of results
+	"""
+	if pool is not None:
+		for result in pool.imap_unordered(func, tasks, chunksize=1):
+			yield result
+		return
+	if not jobs or jobs <= 1:
+		if initializer:
+			initializer(*initargs)
+		for task in tasks:
+			yield func(task)
+		return
+	pool = multiprocessing.Pool(jobs, _init, (initializer, initargs))
+	try:
+		for result in pool.imap_unordered(func, tasks, chunksize=64):
+			yield result
+	finally:
+		pool.close()
+		pool.join()
@@ -18,52 +18,36 @@ import numpy as np
 from PIL import Image
 from lxml import etree
 
+from . import annotations, fanout, labelmap, sharding
+from . import coco as datasets_coco
+
 python_version = sys.version_info.major
 
 ###########################################################
 ##########       YOLO to KITTI Conversion        ##########
 ###########################################################
-def determine_label_kitti(label, labels):
-	"""
-	Definition: Converts label index to label from label set
-
-	Parameters: label - label from file
-				labels - list of labels
-	Returns: label corresponding to index in yolo label
-	"""
-	return str(labels[int(label)])
-
-def parse_labels_kitti(label_file, labels, img_width, img_height):
+def parse_labels_kitti(label_file, label_map, img_width, img_height,
+	fields=None):
 	"""
 	Definition: Parsers label file to extract label and bounding box
 		coordinates. Converts (x, y, width, height) YOLO format to
-		(x1, y1, x2, y2) KITTI format.
+		(x1, y1, x2, y2) KITTI format.  Objects whose class index is not
+		in the label file, or whose class is dropped by the label map, are
+		filtered out here.
 
 	Parameters: label_file - file with YOLO label(s) inside
-				labels - list of labels in dataset
+				label_map - LabelMap built from the label file
 				img_width - width of input image
 				img_height - height of input image
-	Returns: all_labels - contains a list of labels for objects in image
-			 all_coords - contains a list of coordinates for objects in image
+				fields - fields kept in the sidecar for this label file
+	Returns: Annotations with class names resolved
 	"""
-	lfile = open(label_file)
-	coords = []
-	all_coords = []
-	all_labels = []
-	for line in lfile:
-		l = line.split(" ")
-		all_labels.append(determine_label_kitti(l[0], labels))
-		coords = list(map(float, list(map(float, l[1:5]))))
-		x1 = float(img_width) * (2.0 * float(coords[0]) - float(coords[2])) / 2.0
-		y1 = float(img_height) * (2.0 * float(coords[1]) - float(coords[3])) / 2.0
-		x2 = float(img_width) * (2.0 * float(coords[0]) + float(coords[2])) / 2.0
-		y2 = float(img_height) * (2.0 * float(coords[1]) + float(coords[3])) / 2.0
-		tmp = [x1, y1, x2, y2]
-		all_coords.append(list(map(int, tmp)))
-	lfile.close()
-	return all_labels, all_coords
-
-def copy_images_kitti(yolo, kitti):
+	ann = annotations.read_yolo(label_file, img_width, img_height)
+	ann.merge(fields)
+	ann.names, keep = label_map.decode(ann.classes)
+	return ann.select(keep)
+
+def copy_images_kitti(yolo, kitti, shard=None, layout=None):
 	"""
 	Definition: Copy all images from the training and validation sets
 		in yolo format to training and validation image sets in kitti
@@ -71,21 +55,22 @@ def copy_images_kitti(yolo, kitti):
 
 	Parameters: yolo - path to yolo directory (contains 'train' and 'val')
 				kitti - path to kitti output directory
+				shard - (index, num_shards) to only convert the images of one
+					shard, or None
+				layout - (mode, levels) fan-out of the output, or None
 	Returns: None
 	"""
-	for filename in glob.glob(os.path.join(yolo + "train/images/", "*.*")):
-		shutil.copy(filename, kitti + "train/images/")
-	for filename in glob.glob(os.path.join(yolo + "val/images/", "*.*")):
-		shutil.copy(filename, kitti + "val/images/")
-
-	for filename in glob.glob(os.path.join(kitti + "train/images/", "*.*")):
-		im = Image.open(filename)
-		im.save(filename.split(".jpg")[0] + ".png", "png")
-		os.remove(filename)
-	for filename in glob.glob(os.path.join(kitti + "val/images/", "*.*")):
-		im = Image.open(filename)
-		im.save(filename.split(".jpg")[0] + ".png", "png")
-		os.remove(filename)
+	for split in ["train", "val"]:
+		images_dir = yolo + split + "/images/"
+		fanout.make_directories(kitti + split + "/", layout,
+			(key for key, rel, f in fanout.walk(images_dir)
+				if sharding.owns(shard, split + "/" + key)))
+		for key, rel, f in fanout.walk(images_dir):
+			if sharding.owns(shard, split + "/" + key):
+				im = Image.open(images_dir + rel + f)
+				im.save(kitti + split + "/images/" + fanout.subdir(layout, key) +
+					key + ".png", "png")
+				im.close()
 
 def make_kitti_directories(kitti):
 	"""
@@ -111,49 +96,50 @@ def make_kitti_directories(kitti):
 	os.makedirs(kitti + "val/images")
 	os.makedirs(kitti + "val/labels")
 
-def kitti(yolo_dir, kitti_dir, label=None):
+def kitti(yolo_dir, kitti_dir, label=None, label_map=None, shard=None,
+	layout=None):
 	print ("Converting yolo to kitti")
 
-	# Split label file
-	label_file = open(label)
-	labels_split = label_file.read().split('\n')
-
-	# Make all directories for kitti dataset
-	make_kitti_directories(kitti_dir)
-
-	# Iterate through yolo training data
-	for f in os.listdir(yolo_dir + "train/labels/"):
-		fname = (yolo_dir + "train/images/" + f).split(".txt")[0] + ".jpg"
-		if os.path.isfile(fname):
-			img = Image.open(fname)
-			w, h = img.size
-			img.close()
-			labels, coords = parse_labels_kitti(os.path.join(yolo_dir + 
-				"train/labels/" + f), labels_split, w, h)
-			kittif = open(kitti_dir + "train/labels/" + f, "a+")
-			for l, c in zip(labels, coords):
-				kittif.write(l + " 0 0 0 " + str(c[0]) + " " + str(c[1]) +
-					" " + str(c[2]) + " " + str(c[3]) + " 0 0 0 0 0 0 0 0\n")
-			kittif.close()
-
-	# Iterate through yolo validation data
-	for f in os.listdir(yolo_dir + "val/labels/"):
-		fname = (yolo_dir + "val/images/" + f).split(".txt")[0] + ".jpg"
-		if os.path.isfile(fname):
-			img = Image.open(fname)
-			w, h = img.size
-			img.close()
-			labels, coords = parse_labels_kitti(os.path.join(yolo_dir + 
-				"val/labels/" + f), labels_split, w, h)
-			kittif = open(kitti_dir + "val/labels/" + f, "a+")
-			for l, c in zip(labels, coords):
-				kittif.write(l + " 0 0 0 " + str(c[0]) + " " + str(c[1]) +
-					" " + str(c[2]) + " " + str(c[3]) + " 0 0 0 0 0 0 0 0\n")
-			kittif.close()
-
+	# Build class lookup (and optional remapping) from label file
+	lmap = labelmap.load(label, label_map)
+
+	# Make all directories for kitti dataset (a shard only adds to them)
+	if shard:
+		sharding.make_directories(kitti_dir, shard)
+	else:
+		make_kitti_directories(kitti_dir)
+
+	# Iterate through yolo training and validation data, restoring the fields
+	# kept in the sidecar when the dataset was converted to yolo
+	samples = {}
+	for split in ["train", "val"]:
+		sidecar = annotations.Sidecar(yolo_dir + split + "/" + annotations.SIDECAR)
+		labels_dir = yolo_dir + split + "/labels/"
+		fanout.make_directories(kitti_dir + split + "/", layout,
+			(key for key, rel, f in fanout.walk(labels_dir)
+				if sharding.owns(shard, split + "/" + key)))
+		samples[split] = 0
+		for key, rel, f in fanout.walk(labels_dir):
+			if not sharding.owns(shard, split + "/" + key):
+				continue
+			fname = yolo_dir + split + "/images/" + rel + key + ".jpg"
+			if os.path.isfile(fname):
+				img = Image.open(fname)
+				w, h = img.size
+				img.close()
+				ann = parse_labels_kitti(labels_dir + rel + f, lmap, w, h,
+					sidecar.get(key))
+				annotations.write_kitti(kitti_dir + split + "/labels/" +
+					fanout.subdir(layout, key) + key + ".txt", ann)
+				samples[split] += 1
+		sidecar.close()
+	lmap.report()
 
 	# Copy images from yolo to kitti
-	copy_images_kitti(yolo_dir, kitti_dir)
+	copy_images_kitti(yolo_dir, kitti_dir, shard, layout)
+
+	if shard:
+		sharding.write_manifest(kitti_dir, shard, samples)
 
 ###########################################################
 ##########        YOLO to LISA Conversion        ##########
@@ -164,7 +150,7 @@ def lisa(yolo_dir, lisa_dir, label=None):
 ###########################################################
 ##########        YOLO to VOC Conversion         ##########
 ###########################################################
-def write_voc_file(fname, labels, coords, img_width, img_height):
+def write_voc_file(fname, labels, coords, img_width, img_height, fields=None):
 	"""
 	Definition: Writes label into VOC (XML) format.
 
@@ -173,8 +159,12 @@ def write_voc_file(fname, labels, coords, img_width, img_height):
 				coords - list of position of objects in file
 				img_width - width of image
 				img_height - height of image
+				fields - optional per-object annotation fields used for the
+					difficult, occluded and truncated flags
 	Returns: annotation - XML tree for image file
 	"""
+	difficult_flags, occluded_flags, truncated_flags = \
+		annotations.voc_attributes(fields, len(coords))
 	annotation = etree.Element('annotation')
 	filename = etree.Element('filename')
 	f = fname.split("/")
@@ -204,16 +194,16 @@ def write_voc_file(fname, labels, coords, img_width, img_height):
 		ymin.text = str(coords[i][1])
 		bndbox.append(ymin)
 		difficult = etree.Element('difficult')
-		difficult.text = '0'
+		difficult.text = difficult_flags[i]
 		object.append(difficult)
 		occluded = etree.Element('occluded')
-		occluded.text = '0'
+		occluded.text = occluded_flags[i]
 		object.append(occluded)
 		pose = etree.Element('pose')
 		pose.text = 'Unspecified'
 		object.append(pose)
 		truncated = etree.Element('truncated')
-		truncated.text = '1'
+		truncated.text = truncated_flags[i]
 		object.append(truncated)
 	img_size = etree.Element('size')
 	annotation.append(img_size)
@@ -229,44 +219,26 @@ def write_voc_file(fname, labels, coords, img_width, img_height):
 
 	return annotation
 
-def determine_label_voc(label, labels):
-	"""
-	Definition: Converts label index to label from label set
-
-	Parameters: label - label from file
-				labels - list of labels
-	Returns: label corresponding to index in yolo label
-	"""
-	return str(labels[int(label)])
-
-
-def parse_labels_voc(label_file, labels, img_width, img_height):
+def parse_labels_voc(label_file, label_map, img_width, img_height,
+	fields=None):
 	"""
 	Definition: Parses label file to extract label and bounding box
-		coordintates.
+		coordintates.  Objects whose class index is not in the label file,
+		or whose class is dropped by the label map, are filtered out here.
 
 	Parameters: label_file - list of labels in images
-	Returns: all_labels - contains a list of labels for objects in the image
-			 all_coords - contains a list of coordinates for objects in image
+				label_map - LabelMap built from the label file
+				img_width - width of input image
+				img_height - height of input image
+				fields - fields kept in the sidecar for this label file
+	Returns: Annotations with class names resolved
 	"""
-	lfile = open(label_file)
-	coords = []
-	all_coords = []
-	all_labels = []
-	for line in lfile:
-		l = line.split(" ")
-		all_labels.append(determine_label_voc(l[0], labels))
-		coords = list(map(float, list(map(float, l[1:5]))))
-		xmin = float(img_width) * (2.0 * float(coords[0]) - float(coords[2])) / 2.0
-		ymin = float(img_height) * (2.0 * float(coords[1]) - float(coords[3])) / 2.0
-		xmax = float(img_width) * (2.0 * float(coords[0]) + float(coords[2])) / 2.0
-		ymax = float(img_height) * (2.0 * float(coords[1]) + float(coords[3])) / 2.0
-		tmp = [xmin, ymin, xmax, ymax]
-		all_coords.append(list(map(int, tmp)))
-	lfile.close()
-	return all_labels, all_coords
-
-def copy_images_voc(yolo, voc):
+	ann = annotations.read_yolo(label_file, img_width, img_height)
+	ann.merge(fields)
+	ann.names, keep = label_map.decode(ann.classes)
+	return ann.select(keep)
+
+def copy_images_voc(yolo, voc, shard=None, layout=None):
 	"""
 	Definition: Copy all images from the training and validation sets
 		in kitti format to training and validation image sets in voc
@@ -274,21 +246,22 @@ def copy_images_voc(yolo, voc):
 
 	Parameters: yolo - path to yolo directory (contains 'train' and 'val')
 				voc - path to voc output directory
+				shard - (index, num_shards) to only convert the images of one
+					shard, or None
+				layout - (mode, levels) fan-out of the output, or None
 	Returns: None
 	"""
-	for filename in glob.glob(os.path.join(yolo + "train/images/", "*.*")):
-		shutil.copy(filename, voc + "train/images/")
-	for filename in glob.glob(os.path.join(yolo + "val/images/", "*.*")):
-		shutil.copy(filename, voc + "val/images/")
-
-	for filename in glob.glob(os.path.join(voc + "train/images/", "*.*")):
-		im = Image.open(filename)
-		im.save(filename.split(".jpg")[0] + ".png", "png")
-		os.remove(filename)
-	for filename in glob.glob(os.path.join(voc + "val/images/", "*.*")):
-		im = Image.open(filename)
-		im.save(filename.split(".jpg")[0] + ".png", "png")
-		os.remove(filename)
+	for split in ["train", "val"]:
+		images_dir = yolo + split + "/images/"
+		fanout.make_directories(voc + split + "/", layout,
+			(key for key, rel, f in fanout.walk(images_dir)
+				if sharding.owns(shard, split + "/" + key)))
+		for key, rel, f in fanout.walk(images_dir):
+			if sharding.owns(shard, split + "/" + key):
+				im = Image.open(images_dir + rel + f)
+				im.save(voc + split + "/images/" + fanout.subdir(layout, key) +
+					key + ".png", "png")
+				im.close()
 
 def make_voc_directories(voc):
 	"""
@@ -314,42 +287,87 @@ def make_voc_directories(voc):
 	os.makedirs(voc + "val/images")
 	os.makedirs(voc + "val/labels")
 
-def voc(yolo_dir, voc_dir, label=None):
+def voc(yolo_dir, voc_dir, label=None, label_map=None, shard=None,
+	layout=None):
 	print ("Convert yolo to voc")
 
-	# Split label file
-	label_file = open(label)
-	labels_split = label_file.read().split('\n')
-
-	# Make all directories for voc dataset
-	make_voc_directories(voc_dir)
-
-	# Iterate through kitti training data
-	for f in os.listdir(yolo_dir + "train/labels/"):
-		fname = (yolo_dir + "train/images/" + f).split(".txt")[0] + ".jpg"
-		if os.path.isfile(fname):
-			img = Image.open(fname)
-			w, h = img.size
-			img.close()
-			labels, coords = parse_labels_voc(os.path.join(yolo_dir +
-				"train/labels/" + f), labels_split, w, h)
-			annotation = write_voc_file(fname, labels, coords, w, h)
-			et = etree.ElementTree(annotation)
-			et.write(voc_dir + "train/labels/" + f.split(".txt")[0] + ".xml", pretty_print=True)
-
-	# Iterate through kitti validation data
-	for f in os.listdir(yolo_dir + "val/labels/"):
-		fname = (yolo_dir + "val/images/" + f).split(".txt")[0] + ".jpg"
-		if os.path.isfile(fname):
-			img = Image.open(fname)
-			w, h = img.size
-			img.close()
-			labels, coords = parse_labels_voc(os.path.join(yolo_dir +
-				"val/labels/" + f), labels_split, w, h)
-			annotation = write_voc_file(fname, labels, coords, w, h)
-			et = etree.ElementTree(annotation)
-			et.write(voc_dir + "val/labels/" + f.split(".txt")[0] + ".xml", pretty_print=True)
-
-	# Copy images from kitti to voc
-	copy_images_voc(yolo_dir, voc_dir)
+	# Build class lookup (and optional remapping) from label file
+	lmap = labelmap.load(label, label_map)
+
+	# Make all directories for voc dataset (a shard only adds to them)
+	if shard:
+		sharding.make_directories(voc_dir, shard)
+	else:
+		make_voc_directories(voc_dir)
+	meta_dir = sharding.shard_dir(voc_dir, shard)
+
+	# Iterate through yolo training and validation data, restoring the fields
+	# kept in the sidecar when the dataset was converted to yolo
+	samples = {}
+	for split in ["train", "val"]:
+		sidecar = annotations.Sidecar(yolo_dir + split + "/" + annotations.SIDECAR)
+		sfile = open(meta_dir + split + "/" + annotations.SIDECAR, "w")
+		labels_dir = yolo_dir + split + "/labels/"
+		fanout.make_directories(voc_dir + split + "/", layout,
+			(key for key, rel, f in fanout.walk(labels_dir)
+				if sharding.owns(shard, split + "/" + key)))
+		samples[split] = 0
+		for key, rel, f in fanout.walk(labels_dir):
+			if not sharding.owns(shard, split + "/" + key):
+				continue
+			fname = yolo_dir + split + "/images/" + rel + key + ".jpg"
+			if os.path.isfile(fname):
+				img = Image.open(fname)
+				w, h = img.size
+				img.close()
+				ann = parse_labels_voc(labels_dir + rel + f, lmap, w, h,
+					sidecar.get(key))
+				annotation = write_voc_file(fname, list(ann.names),
+					ann.boxes.astype(np.int64).tolist(), w, h, ann.fields)
+				et = etree.ElementTree(annotation)
+				et.write(voc_dir + split + "/labels/" + fanout.subdir(layout, key) + key + ".xml", pretty_print=True)
+				annotations.write_sidecar(sfile, key, ann)
+				samples[split] += 1
+		sidecar.close()
+		sfile.close()
+	lmap.report()
+
+	# Copy images from yolo to voc
+	copy_images_voc(yolo_dir, voc_dir, shard, layout)
+
+	if shard:
+		sharding.write_manifest(voc_dir, shard, samples)
 
+###########################################################
+##########        YOLO to COCO Conversion        ##########
+###########################################################
+def coco(yolo_dir, coco_dir, label=None, label_map=None):
+	print ("Converting yolo to coco")
+
+	# Build class lookup (and optional remapping) from label file
+	lmap = labelmap.load(label, label_map)
+
+	# Make all directories for coco dataset
+	datasets_coco.make_directories(coco_dir, labels=False)
+
+	# Stream each split into its COCO file one image at a time, restoring
+	# the fields kept in the sidecar when the dataset was converted to yolo
+	for split in ["train", "val"]:
+		sidecar = annotations.Sidecar(yolo_dir + split + "/" + annotations.SIDECAR)
+		writer = datasets_coco.CocoWriter(coco_dir + split + "/" +
+			datasets_coco.ANNOTATIONS, lmap.labels)
+		labels_dir = yolo_dir + split + "/labels/"
+		for key, rel, f in fanout.walk(labels_dir):
+			fname = yolo_dir + split + "/images/" + rel + key + ".jpg"
+			if os.path.isfile(fname):
+				img = Image.open(fname)
+				w, h = img.size
+				img.close()
+				ann = parse_labels_kitti(labels_dir + rel + f, lmap, w, h,
+					sidecar.get(key))
+				image_id = writer.add_image(os.path.basename(fname), w, h)
+				writer.add_annotations(image_id, ann)
+				shutil.copy(fname, coco_dir + split + "/images/")
+		sidecar.close()
+		writer.close()
+	lmap.report()
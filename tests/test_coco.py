@@ -0,0 +1,44 @@
+"""
+Tests for the incremental COCO reader.
+
+The reader parses the file in CHUNK sized windows, so every value may be
+cut at a window boundary.  Small chunks put a boundary inside every number.
+
+Run with: python -m pytest tests/
+"""
+
+import os, sys, json
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datasets import coco
+
+COCO = {
+	"version": 1.25,
+	"images": [{"id": 1, "file_name": "000000.jpg", "width": 64,
+		"height": 48}, {"id": 2, "file_name": "000001.jpg", "width": 64,
+		"height": 48}],
+	"annotations": [{"id": 1, "image_id": 2, "category_id": 1,
+		"bbox": [1.5, 2.25, 10, 20.125], "area": 1e2, "iscrowd": 0}],
+	"categories": [{"id": 1, "name": "Car"}],
+	"scale": -3.5e-1,
+}
+
+@pytest.mark.parametrize("chunk", [1, 2, 14, 1 << 20])
+def test_reader_numbers_across_chunks(tmp_path, monkeypatch, chunk):
+	monkeypatch.setattr(coco, "CHUNK", chunk)
+	path = str(tmp_path / coco.ANNOTATIONS)
+	with open(path, "w") as f:
+		json.dump(COCO, f)
+
+	reader = coco.CocoReader(path)
+	try:
+		assert list(reader.image_ids) == [1, 2]
+		assert reader.image(2)["file_name"] == "000001.jpg"
+		assert len(reader.annotations(1)) == 0
+		ann = reader.annotations(2)
+		assert list(ann.names) == ["Car"]
+		assert ann.boxes.tolist() == [[1.5, 2.25, 11.5, 22.375]]
+	finally:
+		reader.close()
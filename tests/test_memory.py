@@ -0,0 +1,241 @@
+"""
+Memory budget tests for the converters.
+
+Each converter path runs on synthetic datasets of growing size in a forked
+process, under tracemalloc (Python and numpy allocations) and getrusage
+(resident set size, which also covers image buffers allocated by PIL).
+Conversions stream one sample at a time and directories are walked without
+listing them in memory, so:
+
+    - peak memory is flat in the number of samples: from the middle to the
+      largest dataset (the smallest one absorbs one-off warm-up) it grows
+      by less than SAMPLE_BUDGET bytes per sample, plus INDEX_BUDGET bytes
+      per entry of the offset index kept when reading sidecar (one entry
+      per sample) and COCO files (one per image and one per annotation)
+    - the peak allocated while parsing a label file stays under
+      BOX_BUDGET bytes per box
+    - the resident set does not grow by more than RSS_BUDGET bytes from the
+      smallest to the largest dataset
+
+Run with: python -m pytest tests/
+"""
+
+import os, sys, io, gc, json, contextlib, tracemalloc, multiprocessing
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datasets import annotations, coco, kitti, lisa, yolo
+
+resource = pytest.importorskip("resource")
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"),
+	reason="measurements run in a forked process")
+
+SAMPLE_BUDGET = 48
+INDEX_BUDGET = 64
+BOX_BUDGET = 2048
+RSS_BUDGET = 16 << 20
+
+SAMPLES = (100, 400, 1600)
+BOXES = (50, 400)
+IMAGE_SIZE = (64, 48)
+
+KITTI_LINE = "Car 0.5 1 -1.57 %d 20.25 %d 40.75 1.52 1.63 3.88 -2.71 1.72 14.05 -1.75\n"
+YOLO_LINE = "0 %.6f 0.25 0.1 0.2\n"
+
+###########################################################
+##########           Synthetic datasets          ##########
+###########################################################
+def make_kitti(root, samples, boxes):
+	img = Image.new("RGB", IMAGE_SIZE, (80, 120, 160))
+	for split in ["train", "val"]:
+		os.makedirs(root + split + "/images")
+		os.makedirs(root + split + "/labels")
+		lines = "".join(KITTI_LINE % (j % 200, j % 200 + 40) for j in range(boxes))
+		for i in range(samples):
+			img.save(root + "%s/images/%06d.png" % (split, i))
+			with open(root + "%s/labels/%06d.txt" % (split, i), "w") as f:
+				f.write(lines)
+	return root
+
+def make_yolo(root, samples, boxes):
+	img = Image.new("RGB", IMAGE_SIZE, (80, 120, 160))
+	for split in ["train", "val"]:
+		os.makedirs(root + split + "/images")
+		os.makedirs(root + split + "/labels")
+		lines = "".join(YOLO_LINE % (0.1 + 0.8 * j / boxes) for j in range(boxes))
+		fields = json.dumps({"truncated": [0.5] * boxes, "occluded": [1] * boxes})
+		with open(root + split + "/" + annotations.SIDECAR, "w") as sfile:
+			for i in range(samples):
+				img.save(root + "%s/images/%06d.jpg" % (split, i))
+				with open(root + "%s/labels/%06d.txt" % (split, i), "w") as f:
+					f.write(lines)
+				sfile.write('{"file": "%06d", "fields": %s}\n' % (i, fields))
+	return root
+
+def make_coco(root, samples, boxes):
+	img = Image.new("RGB", IMAGE_SIZE, (80, 120, 160))
+	for split in ["train", "val"]:
+		os.makedirs(root + split + "/images")
+		with open(root + split + "/" + coco.ANNOTATIONS, "w") as f:
+			f.write('{"images": [')
+			for i in range(samples):
+				img.save(root + "%s/images/%06d.jpg" % (split, i))
+				f.write(("," if i else "") + json.dumps({"id": i + 1,
+					"file_name": "%06d.jpg" % i, "width": IMAGE_SIZE[0],
+					"height": IMAGE_SIZE[1]}))
+			f.write('], "annotations": [')
+			for i in range(samples):
+				for j in range(boxes):
+					f.write(("," if i or j else "") + json.dumps({
+						"id": i * boxes + j + 1, "image_id": i + 1,
+						"category_id": 1, "bbox": [j % 30, 5, 20, 30],
+						"area": 600, "iscrowd": 0,
+						"attributes": {"truncated": 0.5}}))
+			f.write('], "categories": [{"id": 1, "name": "Car"}]}')
+	return root
+
+def make_lisa(root, samples, boxes):
+	os.makedirs(root + "train")
+	os.makedirs(root + "val")
+	for split in ["train", "val"]:
+		with open(root + split + ".csv", "w") as f:
+			f.write("Filename;Annotation tag;Upper left corner X;"
+				"Upper left corner Y;Lower right corner X;Lower right corner Y\n")
+			for i in range(samples):
+				for j in range(boxes):
+					f.write("images/%06d.png;stop;%d;10;%d;50\n" % (i, j, j + 40))
+	return root
+
+###########################################################
+##########              Measurement              ##########
+###########################################################
+def _child(conn, func, args):
+	# Load the image plugins up front so their import is not measured
+	Image.init()
+	start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	gc.collect()
+	tracemalloc.start()
+	with contextlib.redirect_stdout(io.StringIO()):
+		func(*args)
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start
+	# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+	conn.send((peak, rss if sys.platform == "darwin" else rss * 1024))
+
+def measure(func, *args):
+	"""
+	Run func(*args) in a forked process and return its peak traced memory
+	and the growth of its resident set (both in bytes).
+	"""
+	ctx = multiprocessing.get_context("fork")
+	parent, child = ctx.Pipe()
+	process = ctx.Process(target=_child, args=(child, func, args))
+	process.start()
+	result = parent.recv()
+	process.join()
+	assert process.exitcode == 0
+	return result
+
+def run_kitti_yolo(src, out, label):
+	kitti.yolo(src, out, label)
+
+def run_kitti_yolo_resize(src, out, label):
+	kitti.yolo(src, out, label, resize=(32, 24), keep_aspect=True)
+
+def run_kitti_yolo_tile(src, out, label):
+	kitti.yolo(src, out, label, tile=(32, 32), tile_overlap=8)
+
+def run_kitti_voc(src, out, label):
+	kitti.voc(src, out)
+
+def run_kitti_coco(src, out, label):
+	kitti.coco(src, out, label)
+
+def run_yolo_kitti(src, out, label):
+	yolo.kitti(src, out, label)
+
+def run_yolo_voc(src, out, label):
+	yolo.voc(src, out, label)
+
+def run_yolo_coco(src, out, label):
+	yolo.coco(src, out, label)
+
+def run_coco_kitti(src, out, label):
+	coco.kitti(src, out)
+
+def run_coco_yolo(src, out, label):
+	coco.yolo(src, out, label)
+
+def run_lisa_kitti(src, out, label):
+	lisa.create_labels_kitti(src + "train.csv", src + "val.csv",
+		src + "train/", src + "val/")
+
+# Offset index entries kept by each source format (per sample, per box)
+INDEX = {make_kitti: (0, 0), make_yolo: (1, 0), make_coco: (1, 1),
+	make_lisa: (0, 0)}
+
+CONVERTERS = [
+	("kitti.yolo", make_kitti, run_kitti_yolo),
+	("kitti.yolo-resize", make_kitti, run_kitti_yolo_resize),
+	("kitti.yolo-tile", make_kitti, run_kitti_yolo_tile),
+	("kitti.voc", make_kitti, run_kitti_voc),
+	("kitti.coco", make_kitti, run_kitti_coco),
+	("yolo.kitti", make_yolo, run_yolo_kitti),
+	("yolo.voc", make_yolo, run_yolo_voc),
+	("yolo.coco", make_yolo, run_yolo_coco),
+	("coco.kitti", make_coco, run_coco_kitti),
+	("coco.yolo", make_coco, run_coco_yolo),
+	("lisa.create_labels_kitti", make_lisa, run_lisa_kitti),
+]
+
+@pytest.fixture
+def convert(tmp_path, monkeypatch):
+	"""
+	Build a synthetic dataset, convert it into a fresh output directory and
+	return the measurement.  COCO files are parsed in small chunks, so the
+	read window is full at every dataset size and only the index can grow.
+	"""
+	monkeypatch.setattr(coco, "CHUNK", 1 << 14)
+	label = str(tmp_path / "labels.txt")
+	with open(label, "w") as f:
+		f.write("Car\n")
+
+	def run(make, func, samples, boxes):
+		name = "%d_%d" % (samples, boxes)
+		src = make(str(tmp_path / ("src_" + name)) + "/", samples, boxes)
+		return measure(func, src, str(tmp_path / ("out_" + name)) + "/", label)
+	return run
+
+###########################################################
+##########                 Tests                 ##########
+###########################################################
+@pytest.mark.parametrize("name, make, func", CONVERTERS,
+	ids=[c[0] for c in CONVERTERS])
+def test_peak_memory_flat_in_samples(convert, name, make, func):
+	boxes = 5
+	peaks, rss = zip(*[convert(make, func, samples, boxes) for samples in SAMPLES])
+
+	# Growth per sample from the middle to the largest size
+	per_sample = float(peaks[-1] - peaks[-2]) / (SAMPLES[-1] - SAMPLES[-2])
+	entries = INDEX[make][0] + INDEX[make][1] * boxes
+	budget = SAMPLE_BUDGET + INDEX_BUDGET * entries
+	assert per_sample < budget, \
+		"%s: peak grows by %d bytes per sample from %d to %d samples" % (
+			name, per_sample, SAMPLES[-2], SAMPLES[-1])
+	assert rss[-1] - rss[0] < RSS_BUDGET, \
+		"%s: resident set grows by %d bytes" % (name, rss[-1] - rss[0])
+
+@pytest.mark.parametrize("name, make, func", CONVERTERS,
+	ids=[c[0] for c in CONVERTERS])
+def test_allocations_per_box(convert, name, make, func):
+	few, many = BOXES
+	peak_few = convert(make, func, 10, few)[0]
+	peak_many = convert(make, func, 10, many)[0]
+
+	per_box = float(peak_many - peak_few) / (many - few)
+	assert per_box < BOX_BUDGET, \
+		"%s: peak grows by %d bytes per box" % (name, per_box)